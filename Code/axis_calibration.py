@@ -0,0 +1,260 @@
+import os
+import re
+import json
+import glob
+import hashlib
+
+import cv2
+import numpy as np
+import pandas as pd
+
+from chart_digitizer import (AxisCalibration, DEFAULT_SERIES_COLORS, series_centerline, sample_at,
+                             load_calibrations, save_calibrations)
+from content_hash import file_content_hash
+
+CALIBRATION_CACHE_DIR = r"C:\Users\clint\Desktop\Lifecycle_RA\Data\axis_calibrations"
+
+# Gridline steps ($) the report charts use; a fitted step is snapped to the nearest one
+NICE_VALUE_STEPS = (5000, 10000, 20000, 25000, 30000, 40000, 50000)
+
+def index_runs(indices):
+    """Group sorted integer indices into (start, end) runs of consecutive values"""
+    if len(indices) == 0:
+        return []
+    breaks = np.flatnonzero(np.diff(indices) != 1)
+    starts = np.concatenate(([indices[0]], indices[breaks + 1]))
+    ends = np.concatenate((indices[breaks], [indices[-1]]))
+    return list(zip(starts, ends))
+
+def report_last_month(image_path):
+    """
+    Month index of the last point plotted in a report chart: the month before
+    the report's XX_YYYY date in the file name, or None if there is no date
+    """
+    match = re.search(r'(\d+)_(\d{4})', os.path.basename(image_path))
+    if not match:
+        return None
+    month, year = int(match.group(1)), int(match.group(2))
+    return year * 12 + month - 2
+
+def detect_gridlines(image_rgb, min_coverage=0.5):
+    """
+    Return (rows, left, right): centers of the evenly spaced light-gray
+    horizontal gridlines from the top one down to the $0 line, and their x extent
+    """
+    height, width = image_rgb.shape[:2]
+    channel_max = image_rgb.max(axis=2).astype(np.int16)
+    channel_min = image_rgb.min(axis=2).astype(np.int16)
+    gray = (channel_max - channel_min <= 12) & (channel_min >= 180) & (channel_max <= 240)
+
+    runs = index_runs(np.flatnonzero(gray.sum(axis=1) > min_coverage * width))
+    if len(runs) < 2:
+        return np.array([]), 0, width - 1
+    centers = np.array([(start + end) / 2 for start, end in runs])
+
+    # Walk up from the $0 line, keeping lines at the regular spacing (drops frame borders)
+    spacing = np.median(np.diff(centers))
+    rows = [centers[-1]]
+    for center in centers[-2::-1]:
+        if abs((rows[-1] - center) - spacing) <= 0.1 * spacing:
+            rows.append(center)
+        elif rows[-1] - center > spacing * 1.1:
+            break
+    rows = np.array(rows[::-1])
+
+    cols = np.flatnonzero(gray[int(round(rows[-1]))])
+    return rows, int(cols.min()), int(cols.max())
+
+def detect_year_separators(image_rgb, top, bottom, color=(31, 73, 125), tolerance=45, min_coverage=0.6):
+    """Return x centers of the vertical rules drawn between December and January"""
+    band = image_rgb[int(top):int(bottom)].astype(np.int16)
+    mask = np.abs(band - np.array(color, dtype=np.int16)).max(axis=2) <= tolerance
+    cols = np.flatnonzero(mask.sum(axis=0) > min_coverage * (bottom - top))
+    return np.array([(start + end) / 2 for start, end in index_runs(cols)])
+
+def reference_from_combined(combined_df, series=None):
+    """
+    Median of every vintage per month from the combined dataset, indexed by
+    month index, for fitting the value scale of uncalibrated charts
+    """
+    df = combined_df.copy()
+    df['Date'] = pd.to_datetime(df['Date'], errors='coerce')
+    df = df.dropna(subset=['Date'])
+    series = series or [name for name in DEFAULT_SERIES_COLORS if name in df.columns]
+    for name in series:
+        df[name] = pd.to_numeric(df[name].astype(str).str.replace(',', '', regex=False), errors='coerce')
+    df['month_index'] = df['Date'].dt.year * 12 + df['Date'].dt.month - 1
+    return df.groupby('month_index')[series].median()
+
+def calibrate_axes(image_path, last_month=None, value_step=None, reference=None, series_colors=None):
+    """
+    Detect the plot frame, gridlines and year separators of a chart image and fit its AxisCalibration.
+
+    - Values: the bottom gridline is $0. The gridline step is value_step if
+      given, otherwise fitted against `reference` (see reference_from_combined)
+      and snapped to NICE_VALUE_STEPS, otherwise assumed to be $10,000.
+    - Months: separators are category boundaries one year apart, so the month
+      width is their spacing / 12 and each January sits half a month to their
+      right. The year comes from last_month (default: the month before the
+      report date in the file name).
+
+    Returns the calibration with a confidence in [0, 1], or None if the chart
+    has no usable gridlines or separators.
+    """
+    if series_colors is None:
+        series_colors = DEFAULT_SERIES_COLORS
+    image = cv2.imread(image_path)
+    if image is None:
+        raise ValueError(f"Could not read image: {image_path}")
+    image_rgb = image[:, :, ::-1]
+    height, width = image_rgb.shape[:2]
+
+    rows, left, right = detect_gridlines(image_rgb)
+    if len(rows) < 3:
+        print(f"{os.path.basename(image_path)}: no gridlines found")
+        return None
+    zero_row = rows[-1]
+    spacing = float(np.mean(np.diff(rows)))
+    grid_regularity = 1 - min(1.0, float(np.std(np.diff(rows))) / spacing * 10)
+
+    separators = detect_year_separators(image_rgb, rows[0], zero_row)
+    separators = separators[(separators > left) & (separators < right)]
+    if len(separators) < 2:
+        print(f"{os.path.basename(image_path)}: fewer than two year separators found")
+        return None
+    year_px = np.diff(separators)
+    px_per_month = float(np.median(year_px)) / 12
+    separator_regularity = 1 - min(1.0, float(np.std(year_px)) / float(np.median(year_px)) * 10)
+
+    top = max(0, int(rows[0] - spacing / 2))
+    plot_box = (left, top, right + 1, int(zero_row + spacing / 4))
+
+    # Where the series actually end tells how many months follow the last January
+    centerlines = {name: series_centerline(image_rgb, color, plot_box=plot_box)
+                   for name, color in series_colors.items()}
+    has_data = np.zeros(width, dtype=bool)
+    for centerline in centerlines.values():
+        has_data |= ~np.isnan(centerline)
+    if not has_data.any():
+        print(f"{os.path.basename(image_path)}: no series pixels found")
+        return None
+    data_cols = np.flatnonzero(has_data)
+
+    last_jan_x = separators[-1] + px_per_month / 2
+    months_after = (data_cols[-1] - last_jan_x) / px_per_month
+    month_fit = 1 - min(1.0, 2 * abs(months_after - round(months_after)))
+
+    if last_month is None:
+        last_month = report_last_month(image_path)
+    date_known = last_month is not None
+    if date_known:
+        last_jan = last_month - int(round(months_after))
+        # Snap to a January; an offset here means the chart doesn't end where expected
+        snapped = int(round(last_jan / 12)) * 12
+        month_fit *= 1.0 if snapped == last_jan else 0.5
+        last_jan = snapped
+    else:
+        last_jan = 0
+
+    calibration = AxisCalibration(last_jan_x, last_jan, px_per_month, zero_row, 0.0, -1.0 / spacing,
+                                  plot_box=plot_box)
+
+    # Value scale: one gridline step per `spacing` pixels
+    scale_fit = 0.5
+    if value_step is None and reference is not None and date_known:
+        first, last = calibration.x_to_month([data_cols[0], data_cols[-1]])
+        months = np.arange(int(np.ceil(first - 0.25)), int(np.floor(last + 0.25)) + 1)
+        x_positions = calibration.month_to_x(months)
+        ratios = []
+        for name, centerline in centerlines.items():
+            if name not in reference.columns:
+                continue
+            steps = calibration.y_to_value(sample_at(centerline, x_positions, px_per_month / 2))
+            known = reference[name].reindex(months).to_numpy(dtype=float)
+            ok = ~np.isnan(steps) & ~np.isnan(known) & (steps > 0.5)
+            ratios.append(known[ok] / steps[ok])
+        ratios = np.concatenate(ratios) if ratios else np.array([])
+        if ratios.size >= 3:
+            fitted = float(np.median(ratios))
+            value_step = min(NICE_VALUE_STEPS, key=lambda step: abs(step - fitted))
+            scale_fit = max(0.0, 1 - abs(fitted - value_step) / value_step * 5)
+    elif value_step is not None:
+        scale_fit = 1.0
+    if value_step is None:
+        value_step = 10000
+    calibration.value_per_px = -float(value_step) / spacing
+
+    calibration.confidence = round(float(max(0.0, grid_regularity) * max(0.0, separator_regularity)
+                                   * month_fit * scale_fit * (1.0 if date_known else 0.5)), 3)
+    return calibration
+
+def calibration_params_key(last_month=None, value_step=None, reference=None, series_colors=None):
+    """
+    Short digest of the calibrate_axes arguments, or '' when all are defaults,
+    so calibrations made with a different reference or step are cached apart
+    """
+    if last_month is None and value_step is None and reference is None and series_colors is None:
+        return ''
+    digest = hashlib.sha256()
+    digest.update(json.dumps([last_month, value_step,
+                              sorted((name, [int(c) for c in color]) for name, color in (series_colors or {}).items())]).encode())
+    if reference is not None:
+        digest.update(json.dumps([str(col) for col in reference.columns]).encode())
+        digest.update(pd.util.hash_pandas_object(reference, index=True).to_numpy().tobytes())
+    return digest.hexdigest()[:16]
+
+def calibrate_image(image_path, cache_dir=CALIBRATION_CACHE_DIR, refresh=False, **kwargs):
+    """
+    calibrate_axes with a per-image cache keyed by content hash and the
+    calibration arguments, so each image is only analysed once per set of
+    arguments; refresh=True recomputes it
+    """
+    image_hash = file_content_hash(image_path)
+    params_key = calibration_params_key(**kwargs)
+    cache_name = f"{image_hash}_{params_key}" if params_key else image_hash
+    cache_path = os.path.join(cache_dir, f"{cache_name}.json")
+    if not refresh and os.path.isfile(cache_path):
+        with open(cache_path, 'r', encoding='utf-8') as f:
+            return AxisCalibration.from_dict(json.load(f))
+
+    calibration = calibrate_axes(image_path, **kwargs)
+    if calibration is not None:
+        os.makedirs(cache_dir, exist_ok=True)
+        tmp_path = cache_path + ".tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(calibration.to_dict(), f, indent=2)
+        os.replace(tmp_path, cache_path)
+    return calibration
+
+def calibrate_images(image_paths, min_confidence=0.5, **kwargs):
+    """
+    Calibrate a batch of images; returns {image_name: AxisCalibration} for
+    those at or above min_confidence and prints the ones needing manual calibration
+    """
+    calibrations = {}
+    manual = []
+    for image_path in image_paths:
+        calibration = calibrate_image(image_path, **kwargs)
+        name = os.path.basename(image_path)
+        if calibration is not None and (calibration.confidence or 0) >= min_confidence:
+            calibrations[name] = calibration
+        else:
+            manual.append(name)
+    print(f"Calibrated {len(calibrations)} of {len(image_paths)} images automatically")
+    for name in manual:
+        print(f"  Needs manual calibration: {name}")
+    return calibrations
+
+if __name__ == "__main__":
+    image_dir = r"C:\Users\clint\Desktop\Lifecycle_RA\Data\cropped_sorted"
+    combined_path = r"C:\Users\clint\Desktop\Lifecycle_RA\Data\Processed\Combined_Csvs\combined_data.csv"
+    calibration_path = r"C:\Users\clint\Desktop\Lifecycle_RA\Data\axis_calibrations.json"
+
+    # Manual calibrations win; only images without one are calibrated automatically
+    calibrations = load_calibrations(calibration_path) if os.path.isfile(calibration_path) else {}
+    image_paths = [path for path in sorted(glob.glob(os.path.join(image_dir, "*.png")))
+                   if os.path.basename(path) not in calibrations]
+    reference = reference_from_combined(pd.read_csv(combined_path)) if os.path.isfile(combined_path) else None
+    calibrations.update(calibrate_images(image_paths, reference=reference))
+    save_calibrations(calibrations, calibration_path)
+    print(f"Calibrations saved to {calibration_path}")
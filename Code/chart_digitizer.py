@@ -0,0 +1,288 @@
+import os
+import re
+import json
+import glob
+from datetime import datetime
+from concurrent.futures import ProcessPoolExecutor
+
+import cv2
+import numpy as np
+import pandas as pd
+
+# Line colors (RGB) used by the J.D. Power sleeper price charts
+DEFAULT_SERIES_COLORS = {
+    '4YO': (192, 80, 77),
+    '5YO': (155, 187, 89),
+    '3YO': (79, 129, 189),
+    '3-5YO Avg.': (31, 73, 125),
+}
+
+MONTH_NAMES = ['Jan', 'Feb', 'Mar', 'Apr', 'May', 'Jun', 'Jul', 'Aug', 'Sep', 'Oct', 'Nov', 'Dec']
+
+def parse_month_label(label):
+    """Convert a label like 'Jan-16' or 'Jan 2016' to a month index (year * 12 + month - 1)"""
+    for fmt in ('%b-%y', '%b-%Y', '%b %Y', '%Y-%m'):
+        try:
+            date = datetime.strptime(label.strip(), fmt)
+            return date.year * 12 + date.month - 1
+        except ValueError:
+            continue
+    raise ValueError(f"Unrecognized month label: {label}")
+
+def month_labels(month_indices):
+    """
+    Label months the way the digitized CSVs do: 'Jan-16' for the first row and
+    every January, the bare month name otherwise (see processing_data.process_dates)
+    """
+    labels = []
+    for i, month_index in enumerate(month_indices):
+        year, month = divmod(int(month_index), 12)
+        if i == 0 or month == 0:
+            labels.append(f"{MONTH_NAMES[month]}-{year % 100:02d}")
+        else:
+            labels.append(MONTH_NAMES[month])
+    return labels
+
+class AxisCalibration:
+    """
+    Linear pixel <-> (month, value) mapping for one chart image.
+
+    x_px = x_origin_px + (month_index - origin_month) * px_per_month
+    value = origin_value + (y_px - y_origin_px) * value_per_px
+
+    plot_box (left, top, right, bottom) limits where series pixels are looked for.
+    first_month / last_month, if set, fix the months written to the CSV.
+    confidence is set by automatic calibration (axis_calibration.py); None means manual.
+    """
+    def __init__(self, x_origin_px, origin_month, px_per_month, y_origin_px, origin_value, value_per_px,
+                 plot_box=None, first_month=None, last_month=None, confidence=None):
+        self.x_origin_px = float(x_origin_px)
+        self.origin_month = int(origin_month)
+        self.px_per_month = float(px_per_month)
+        self.y_origin_px = float(y_origin_px)
+        self.origin_value = float(origin_value)
+        self.value_per_px = float(value_per_px)
+        self.plot_box = tuple(int(v) for v in plot_box) if plot_box is not None else None
+        self.first_month = first_month
+        self.last_month = last_month
+        self.confidence = confidence
+
+    @classmethod
+    def from_reference_points(cls, x_refs, y_refs, plot_box=None, first_month=None, last_month=None):
+        """
+        Build a calibration from two x references ((px, 'Jan-16'), (px, 'Jan-19'))
+        and two y references ((px, 100000), (px, 0))
+        """
+        (x1, label1), (x2, label2) = x_refs
+        m1, m2 = parse_month_label(label1), parse_month_label(label2)
+        (y1, v1), (y2, v2) = y_refs
+        if m1 == m2 or y1 == y2:
+            raise ValueError("Reference points must differ in month and in pixel row")
+        if isinstance(first_month, str):
+            first_month = parse_month_label(first_month)
+        if isinstance(last_month, str):
+            last_month = parse_month_label(last_month)
+        return cls(x1, m1, (x2 - x1) / (m2 - m1), y1, v1, (v2 - v1) / (y2 - y1),
+                   plot_box, first_month, last_month)
+
+    def month_to_x(self, month_index):
+        return self.x_origin_px + (np.asarray(month_index) - self.origin_month) * self.px_per_month
+
+    def x_to_month(self, x_px):
+        return self.origin_month + (np.asarray(x_px) - self.x_origin_px) / self.px_per_month
+
+    def y_to_value(self, y_px):
+        return self.origin_value + (np.asarray(y_px) - self.y_origin_px) * self.value_per_px
+
+    def to_dict(self):
+        return {
+            'x_origin_px': self.x_origin_px,
+            'origin_month': self.origin_month,
+            'px_per_month': self.px_per_month,
+            'y_origin_px': self.y_origin_px,
+            'origin_value': self.origin_value,
+            'value_per_px': self.value_per_px,
+            'plot_box': list(self.plot_box) if self.plot_box is not None else None,
+            'first_month': self.first_month,
+            'last_month': self.last_month,
+            'confidence': self.confidence,
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(**data)
+
+def load_calibrations(path):
+    """Load a JSON file of {image_name: calibration dict}"""
+    with open(path, 'r', encoding='utf-8') as f:
+        return {name: AxisCalibration.from_dict(data) for name, data in json.load(f).items()}
+
+def save_calibrations(calibrations, path):
+    """Write {image_name: AxisCalibration} as JSON"""
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump({name: cal.to_dict() for name, cal in calibrations.items()}, f, indent=2)
+
+def series_centerline(image_rgb, color, tolerance=40, plot_box=None, max_line_fraction=0.5):
+    """
+    Return the mean row of pixels matching color in every column (NaN where the series is absent).
+
+    Columns where the color covers more than max_line_fraction of the plot
+    height are treated as vertical rules (e.g. year separators) and dropped.
+    """
+    height, width = image_rgb.shape[:2]
+    left, top, right, bottom = plot_box if plot_box is not None else (0, 0, width, height)
+
+    region = image_rgb[top:bottom, left:right].astype(np.int16)
+    mask = (np.abs(region - np.array(color, dtype=np.int16)).max(axis=2) <= tolerance)
+
+    counts = mask.sum(axis=0)
+    rows = np.arange(top, bottom, dtype=np.float64)
+    row_sums = rows @ mask
+    valid = (counts > 0) & (counts <= max_line_fraction * (bottom - top))
+
+    centerline = np.full(width, np.nan)
+    centerline[left:right] = np.where(valid, row_sums / np.maximum(counts, 1), np.nan)
+    return centerline
+
+def sample_at(centerline, x_positions, max_gap):
+    """
+    Interpolate a per-column centerline at x_positions, returning NaN where the
+    nearest column with data is more than max_gap pixels away (e.g. past the line's end)
+    """
+    valid_cols = np.flatnonzero(~np.isnan(centerline))
+    x_positions = np.asarray(x_positions, dtype=np.float64)
+    if valid_cols.size == 0:
+        return np.full(x_positions.shape, np.nan)
+
+    values = np.interp(x_positions, valid_cols, centerline[valid_cols])
+    idx = np.clip(np.searchsorted(valid_cols, x_positions), 1, valid_cols.size - 1) if valid_cols.size > 1 \
+        else np.zeros(x_positions.shape, dtype=int)
+    nearest = np.minimum(np.abs(valid_cols[idx] - x_positions), np.abs(valid_cols[idx - 1] - x_positions)) \
+        if valid_cols.size > 1 else np.abs(valid_cols[0] - x_positions)
+    return np.where(nearest <= max_gap, values, np.nan)
+
+def digitize_image(image_path, calibration, series_colors=None, tolerance=40, round_to=100):
+    """
+    Extract each colored series from a chart image into a DataFrame with the
+    layout combine_csv_files consumes: Month, then one column per series
+    """
+    if series_colors is None:
+        series_colors = DEFAULT_SERIES_COLORS
+
+    image = cv2.imread(image_path)
+    if image is None:
+        raise ValueError(f"Could not read image: {image_path}")
+    image_rgb = image[:, :, ::-1]
+    height, width = image_rgb.shape[:2]
+
+    centerlines = {name: series_centerline(image_rgb, color, tolerance, calibration.plot_box)
+                   for name, color in series_colors.items()}
+
+    # Months to report: fixed by the calibration, or every month whose x position has data
+    if calibration.first_month is not None and calibration.last_month is not None:
+        months = np.arange(calibration.first_month, calibration.last_month + 1)
+    else:
+        has_data = np.zeros(width, dtype=bool)
+        for centerline in centerlines.values():
+            has_data |= ~np.isnan(centerline)
+        if not has_data.any():
+            return pd.DataFrame(columns=['Month'] + list(series_colors))
+        cols = np.flatnonzero(has_data)
+        first, last = calibration.x_to_month([cols[0], cols[-1]])
+        step = np.sign(calibration.px_per_month)
+        months = np.arange(int(np.ceil(min(first, last) - 0.25 * step)), int(np.floor(max(first, last) + 0.25 * step)) + 1)
+
+    x_positions = calibration.month_to_x(months)
+    max_gap = abs(calibration.px_per_month) / 2
+
+    data = {'Month': month_labels(months)}
+    for name, centerline in centerlines.items():
+        values = calibration.y_to_value(sample_at(centerline, x_positions, max_gap))
+        if round_to:
+            values = np.round(values / round_to) * round_to
+        data[name] = values
+
+    df = pd.DataFrame(data)
+    # Drop series that never appear in this chart
+    empty = [name for name in series_colors if df[name].isna().all()]
+    return df.drop(columns=empty)
+
+def output_csv_name(image_path):
+    """Name the CSV after the image's XX_YYYY pattern, as image_to_csv does"""
+    image_name = os.path.basename(image_path)
+    match = re.search(r'(\d+_\d+)', image_name)
+    base_name = match.group(1) if match else os.path.splitext(image_name)[0]
+    return f"{base_name}.csv"
+
+def output_csv_paths(image_paths, output_dir):
+    """
+    {image_path: CSV path} for a batch, named as image_to_csv.save_result_csv
+    does: XX_YYYY.csv, or XX_YYYY_2.csv, _3, ... when that name is already
+    in output_dir or taken by an earlier image of the batch (several charts
+    per report, "copy" variants), so no result overwrites another
+    """
+    taken = set()
+    paths = {}
+    for image_path in image_paths:
+        base_name = os.path.splitext(output_csv_name(image_path))[0]
+        counter = 1
+        new_filename = f"{base_name}.csv"
+        while new_filename in taken or os.path.exists(os.path.join(output_dir, new_filename)):
+            counter += 1
+            new_filename = f"{base_name}_{counter}.csv"
+        taken.add(new_filename)
+        paths[image_path] = os.path.join(output_dir, new_filename)
+    return paths
+
+def _digitize_to_csv(args):
+    image_path, calibration, output_path, series_colors, tolerance = args
+    try:
+        df = digitize_image(image_path, calibration, series_colors, tolerance)
+    except Exception as e:
+        return image_path, None, str(e)
+    df.to_csv(output_path, index=False)
+    return image_path, output_path, None
+
+def digitize_images(image_paths, calibrations, output_dir=None, series_colors=None, tolerance=40, workers=1):
+    """
+    Digitize a batch of chart images offline.
+
+    calibrations maps image file names to AxisCalibration objects; images
+    without one are skipped. Output names are fixed up front (see
+    output_csv_paths), so parallel workers never write the same file.
+    Returns {image_path: csv_path} for successes.
+    """
+    if output_dir is None:
+        output_dir = r"C:\Users\clint\Desktop\Lifecycle_RA\Data\local_digitized_csvs"
+    os.makedirs(output_dir, exist_ok=True)
+
+    calibrated = []
+    for image_path in image_paths:
+        if calibrations.get(os.path.basename(image_path)) is None:
+            print(f"Skipping {os.path.basename(image_path)}: no axis calibration")
+            continue
+        calibrated.append(image_path)
+    output_paths = output_csv_paths(calibrated, output_dir)
+    jobs = [(image_path, calibrations[os.path.basename(image_path)], output_paths[image_path], series_colors, tolerance)
+            for image_path in calibrated]
+
+    if workers > 1:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            results = list(executor.map(_digitize_to_csv, jobs))
+    else:
+        results = [_digitize_to_csv(job) for job in jobs]
+
+    written = {}
+    for image_path, output_path, error in results:
+        if error:
+            print(f"Failed to digitize {os.path.basename(image_path)}: {error}")
+        else:
+            print(f"Digitized {os.path.basename(image_path)} -> {output_path}")
+            written[image_path] = output_path
+    print(f"Digitized {len(written)} of {len(image_paths)} images")
+    return written
+
+if __name__ == "__main__":
+    image_dir = r"C:\Users\clint\Desktop\Lifecycle_RA\Data\cropped_sorted"
+    calibration_path = r"C:\Users\clint\Desktop\Lifecycle_RA\Data\axis_calibrations.json"
+    digitize_images(sorted(glob.glob(os.path.join(image_dir, "*.png"))), load_calibrations(calibration_path))
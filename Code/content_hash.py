@@ -0,0 +1,11 @@
+import hashlib
+
+def file_content_hash(path, chunk_size=1 << 20):
+    """
+    Return the SHA-256 hex digest of a file's contents
+    """
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
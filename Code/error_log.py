@@ -0,0 +1,187 @@
+import os
+import csv
+import atexit
+import sqlite3
+import threading
+import traceback
+from datetime import datetime
+
+ERROR_FIELDS = ('Timestamp', 'Image_Name', 'Image_Path', 'Error_Type', 'Stage', 'Exception_Type',
+                'Error_Message', 'Elapsed_Seconds', 'Worker', 'Traceback')
+
+ERROR_SCHEMA = """
+CREATE TABLE IF NOT EXISTS errors (
+    timestamp TEXT NOT NULL,
+    image_name TEXT,
+    image_path TEXT,
+    error_type TEXT NOT NULL,
+    stage TEXT,
+    exception_type TEXT,
+    error_message TEXT,
+    elapsed_seconds REAL,
+    worker TEXT,
+    traceback TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_errors_type ON errors (error_type, timestamp);
+CREATE INDEX IF NOT EXISTS idx_errors_image ON errors (image_name);
+CREATE INDEX IF NOT EXISTS idx_errors_stage ON errors (stage);
+"""
+
+def describe_exception(exc):
+    """
+    A message that is never blank: Selenium exceptions raised without a
+    message stringify as just "Message:" or "Message: None", which says
+    nothing on its own
+    """
+    if hasattr(exc, 'msg'):
+        # Selenium WebDriverException: use the message itself, without the "Message:" wrapper
+        message = (exc.msg or '').strip()
+    else:
+        message = str(exc).strip()
+    if not message:
+        return f"{type(exc).__name__} (no message)"
+    return message
+
+class ErrorLog:
+    """
+    Thread-safe, buffered error sink.
+
+    Records are kept in memory and written in batches, every flush_every
+    records or on flush()/close() (also registered to run at exit), to the
+    CSV at csv_path and, if db_path is set, to an indexed SQLite table for
+    querying with query().
+    """
+    def __init__(self, csv_path, db_path=None, flush_every=20):
+        self.csv_path = csv_path
+        self.db_path = db_path
+        self.flush_every = flush_every
+        self._buffer = []
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        atexit.register(self.flush)
+
+    def log(self, image_path, error_type, exc=None, message=None, stage=None, elapsed=None):
+        """Record one error; exc supplies the exception type, message and traceback"""
+        if message is None:
+            message = describe_exception(exc) if exc is not None else ''
+        trace = ''
+        if exc is not None and exc.__traceback__ is not None:
+            trace = ''.join(traceback.format_exception(type(exc), exc, exc.__traceback__))
+        record = {
+            'Timestamp': datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+            'Image_Name': os.path.basename(image_path) if image_path else '',
+            'Image_Path': image_path or '',
+            'Error_Type': error_type,
+            'Stage': stage or '',
+            'Exception_Type': type(exc).__name__ if exc is not None else '',
+            'Error_Message': message,
+            'Elapsed_Seconds': round(elapsed, 3) if elapsed is not None else '',
+            'Worker': threading.current_thread().name,
+            'Traceback': trace,
+        }
+        with self._lock:
+            self._buffer.append(record)
+            pending = len(self._buffer)
+        print(f"Error logged ({error_type}{', ' + stage if stage else ''}): {message}")
+        if pending >= self.flush_every:
+            self.flush()
+
+    def flush(self):
+        """Write all buffered records; returns how many were written"""
+        # One flusher at a time so batches land in the files in order
+        with self._flush_lock:
+            with self._lock:
+                records, self._buffer = self._buffer, []
+            if not records:
+                return 0
+            try:
+                self._write_csv(records)
+                if self.db_path:
+                    self._write_db(records)
+            except Exception as e:
+                print(f"Could not write error log: {e}")
+                with self._lock:
+                    self._buffer[:0] = records
+                return 0
+            return len(records)
+
+    def _write_csv(self, records):
+        directory = os.path.dirname(self.csv_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        if os.path.isfile(self.csv_path):
+            with open(self.csv_path, 'r', newline='', encoding='utf-8') as f:
+                header = next(csv.reader(f), None)
+            if header is not None and tuple(header) != ERROR_FIELDS:
+                # Log from before the structured columns: keep it under a separate name
+                root, ext = os.path.splitext(self.csv_path)
+                legacy_path = f"{root}_legacy_{datetime.now().strftime('%Y%m%d_%H%M%S')}{ext}"
+                os.replace(self.csv_path, legacy_path)
+                print(f"Moved old-format error log to {legacy_path}")
+        file_exists = os.path.isfile(self.csv_path)
+        with open(self.csv_path, mode='a', newline='', encoding='utf-8') as f:
+            writer = csv.DictWriter(f, fieldnames=ERROR_FIELDS)
+            if not file_exists:
+                writer.writeheader()
+            writer.writerows(records)
+
+    def _write_db(self, records):
+        conn = sqlite3.connect(self.db_path)
+        try:
+            conn.executescript(ERROR_SCHEMA)
+            with conn:
+                conn.executemany(
+                    "INSERT INTO errors VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                    [tuple(None if record[field] == '' else record[field] for field in ERROR_FIELDS)
+                     for record in records])
+        finally:
+            conn.close()
+
+    def query(self, error_type=None, stage=None, image_name=None, since=None, limit=None):
+        """
+        Logged errors as a list of dicts, newest first, filtered by error
+        type, stage, image name and/or a 'YYYY-MM-DD[ HH:MM:SS]' lower bound
+        """
+        if not self.db_path:
+            raise ValueError("This error log has no database")
+        self.flush()
+        if not os.path.isfile(self.db_path):
+            return []
+        clauses, params = [], []
+        for column, value in (('error_type', error_type), ('stage', stage), ('image_name', image_name)):
+            if value is not None:
+                clauses.append(f"{column} = ?")
+                params.append(value)
+        if since is not None:
+            clauses.append("timestamp >= ?")
+            params.append(since)
+        sql = "SELECT * FROM errors"
+        if clauses:
+            sql += " WHERE " + " AND ".join(clauses)
+        sql += " ORDER BY timestamp DESC"
+        if limit is not None:
+            sql += f" LIMIT {int(limit)}"
+        conn = sqlite3.connect(self.db_path)
+        conn.row_factory = sqlite3.Row
+        try:
+            return [dict(row) for row in conn.execute(sql, params)]
+        finally:
+            conn.close()
+
+    def summary(self, since=None):
+        """{(error_type, stage): count} over the database, optionally from a 'YYYY-MM-DD HH:MM:SS' timestamp on"""
+        if not self.db_path:
+            raise ValueError("This error log has no database")
+        self.flush()
+        if not os.path.isfile(self.db_path):
+            return {}
+        conn = sqlite3.connect(self.db_path)
+        try:
+            rows = conn.execute("SELECT error_type, stage, COUNT(*) FROM errors WHERE timestamp >= ? "
+                                "GROUP BY error_type, stage", (since or '',))
+            return {(error_type, stage): count for error_type, stage, count in rows}
+        finally:
+            conn.close()
+
+    def close(self):
+        self.flush()
@@ -0,0 +1,74 @@
+import sys
+import time
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlparse, parse_qs
+
+# Local stand-in for graph2table.com so the upload automation in image_to_csv.py
+# can be exercised without the real site, e.g.
+#   python graph2table_stub.py 8765
+#   out = tempfile.mkdtemp()
+#   process_all_images(images, workers=4, site_url="http://localhost:8765/", output_dir=out,
+#                      download_root=os.path.join(out, "downloads"), use_cache=False,
+#                      journal_path=None, timings_path=None)
+# Its CSVs are fake, so keep them out of cropped_sorted_csvs and the digitization cache.
+
+# Seconds between the upload and the download button appearing
+PROCESSING_DELAY = 0.5
+
+PAGE = """<!DOCTYPE html>
+<html>
+<head><title>Graph2Table stand-in</title></head>
+<body>
+  <input type="file" id="fileInput" style="display:none">
+  <button id="downloadBtn" style="display:none">Download CSV</button>
+  <script>
+    const fileInput = document.getElementById('fileInput');
+    const downloadBtn = document.getElementById('downloadBtn');
+    fileInput.addEventListener('change', () => {
+      setTimeout(() => { downloadBtn.style.display = 'inline'; }, %d);
+    });
+    downloadBtn.addEventListener('click', () => {
+      const name = fileInput.files.length ? fileInput.files[0].name : 'unknown';
+      window.location.href = '/result.csv?image=' + encodeURIComponent(name);
+    });
+  </script>
+</body>
+</html>
+"""
+
+# Echo the uploaded image name so tests can check each CSV came from the right image
+RESULT_CSV = "Month,4YO,5YO,Image\nJan-16,70000,57000,{image}\nFeb,68000,56000,{image}\n"
+
+class Graph2TableStubHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        url = urlparse(self.path)
+        if url.path == "/result.csv":
+            image = parse_qs(url.query).get("image", ["unknown"])[0]
+            body = RESULT_CSV.format(image=image).encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "text/csv")
+            self.send_header("Content-Disposition", 'attachment; filename="graph2table.csv"')
+        else:
+            body = (PAGE % int(PROCESSING_DELAY * 1000)).encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "text/html")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        print(f"[stub {time.strftime('%H:%M:%S')}] {format % args}")
+
+def run_stub_server(port=8765):
+    """Serve the stand-in page on localhost until interrupted"""
+    server = ThreadingHTTPServer(("localhost", port), Graph2TableStubHandler)
+    print(f"Graph2Table stand-in running at http://localhost:{port}/")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        print("Stopping stand-in server")
+    finally:
+        server.server_close()
+
+if __name__ == "__main__":
+    run_stub_server(int(sys.argv[1]) if len(sys.argv) > 1 else 8765)
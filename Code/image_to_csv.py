@@ -10,7 +10,40 @@ import glob
 import re
 from pathlib import Path
 import csv
+import json
+import hashlib
+import queue
+import threading
+import asyncio
+import functools
 from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
+
+from content_hash import file_content_hash
+from error_log import ErrorLog, describe_exception
+from run_journal import RunJournal
+
+GRAPH2TABLE_URL = "https://graph2table.com/"
+DOWNLOADS_DIR = r"C:\Users\clint\Downloads"
+STAGE_TIMINGS_PATH = r"C:\Users\clint\Desktop\Lifecycle_RA\stage_timings.csv"
+TARGET_CSV_DIR = r"C:\Users\clint\Desktop\Lifecycle_RA\Data\cropped_sorted_csvs"
+CACHE_DIR = r"C:\Users\clint\Desktop\Lifecycle_RA\Data\digitization_cache"
+
+ERROR_LOG_PATH = r"C:\Users\clint\Desktop\Lifecycle_RA\processing_errors.csv"
+ERROR_DB_PATH = r"C:\Users\clint\Desktop\Lifecycle_RA\processing_errors.sqlite"
+JOURNAL_PATH = r"C:\Users\clint\Desktop\Lifecycle_RA\digitization_journal.sqlite"
+
+# Buffered, thread-safe error log shared by all workers; flushed in batches and at exit
+ERROR_LOG = ErrorLog(ERROR_LOG_PATH, db_path=ERROR_DB_PATH)
+
+# Suffixes browsers use for downloads that are still being written
+PARTIAL_DOWNLOAD_SUFFIXES = ('.crdownload', '.part', '.partial', '.download', '.tmp')
+
+# Stages timed by automate_graph2table_upload, in the order they happen
+TIMED_STAGES = ('browser_start', 'page_load', 'processing', 'download', 'post_process', 'total')
+
+# Serializes picking a free target file name when several workers finish at once
+_target_name_lock = threading.Lock()
 
 def get_image_files(directory):
     """Get all image files from the specified directory"""
@@ -22,198 +55,959 @@ def get_image_files(directory):
     
     return image_files
 
-def log_error_to_csv(image_path, error_type, error_message):
-    """Log an error to the CSV file"""
-    error_log_path = r"C:\Users\clint\Desktop\Lifecycle_RA\processing_errors.csv"
+def log_error(image_path, error_type, exc=None, message=None, stage=None, elapsed=None):
+    """Record an error in the shared buffered error log (see error_log.ErrorLog)"""
+    ERROR_LOG.log(image_path, error_type, exc=exc, message=message, stage=stage, elapsed=elapsed)
+
+def create_driver(download_dir=None):
+    """Start a Chrome session with a maximized window, optionally saving downloads to download_dir"""
+    options = webdriver.ChromeOptions()
+    if download_dir:
+        os.makedirs(download_dir, exist_ok=True)
+        options.add_experimental_option("prefs", {
+            "download.default_directory": os.path.abspath(download_dir),
+            "download.prompt_for_download": False,
+            "download.directory_upgrade": True,
+        })
+    driver = webdriver.Chrome(options=options)
     
-    # Check if file exists to determine if we need to write headers
-    file_exists = os.path.isfile(error_log_path)
+    # Maximize the browser window to ensure all elements are visible
+    driver.maximize_window()
+    return driver
+
+def quit_driver(driver):
+    """Close a browser session, falling back to closing the tab if quit fails"""
+    try:
+        driver.quit()
+        print("Browser closed successfully")
+    except Exception as e:
+        print(f"Error closing browser: {e}")
+        # If normal quit fails, try more aggressive termination
+        try:
+            driver.close()
+            print("Browser tab closed")
+        except:
+            print("Could not close browser normally")
+
+def driver_is_healthy(driver):
+    """Return True if the browser session still responds to commands"""
+    try:
+        driver.execute_script("return document.readyState")
+        return bool(driver.window_handles)
+    except Exception:
+        return False
+
+def reset_driver_page(driver):
+    """Leave the current page so no upload state or pending scripts carry over to the next image"""
+    driver.get("about:blank")
+    driver.delete_all_cookies()
+
+class DriverPool:
+    """
+    Pool of reusable Chrome sessions.
+
+    Sessions are created lazily up to `size`, handed out with acquire() and
+    returned with release(). A returned session has its page reset; sessions
+    that fail the health check, or have served `max_uses` uploads, are quit and
+    replaced on the next acquire().
+    """
+    def __init__(self, size=1, max_uses=50, driver_factory=create_driver):
+        self.size = size
+        self.max_uses = max_uses
+        self.driver_factory = driver_factory
+        self._idle = queue.Queue()
+        self._uses = {}
+        self._lock = threading.Lock()
+        self._created = 0
     
-    # Current timestamp
-    timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    def acquire(self):
+        """Get a healthy session, starting a new one if none are idle and the pool isn't full"""
+        while True:
+            try:
+                driver = self._idle.get_nowait()
+            except queue.Empty:
+                with self._lock:
+                    can_create = self._created < self.size
+                    if can_create:
+                        self._created += 1
+                if can_create:
+                    try:
+                        driver = self.driver_factory()
+                    except Exception:
+                        with self._lock:
+                            self._created -= 1
+                        raise
+                    self._uses[id(driver)] = 0
+                    print(f"Started browser session ({self._created}/{self.size})")
+                    return driver
+                # Pool is full, wait for a session to be released
+                driver = self._idle.get()
+            
+            if driver_is_healthy(driver):
+                return driver
+            print("Browser session is unresponsive, replacing it")
+            self._discard(driver)
     
-    # Prepare row data
-    row_data = {
-        'Timestamp': timestamp,
-        'Image_Name': os.path.basename(image_path),
-        'Image_Path': image_path,
-        'Error_Type': error_type,
-        'Error_Message': error_message
-    }
+    def release(self, driver, discard=False):
+        """
+        Return a session to the pool after resetting its page, or discard it if
+        it is broken or worn out. discard=True always quits it, e.g. to cancel a
+        download still in flight after a failed upload.
+        """
+        self._uses[id(driver)] = self._uses.get(id(driver), 0) + 1
+        if discard or self._uses[id(driver)] >= self.max_uses:
+            self._discard(driver)
+            return
+        try:
+            reset_driver_page(driver)
+        except Exception as e:
+            print(f"Could not reset browser session ({e}), replacing it")
+            self._discard(driver)
+            return
+        self._idle.put(driver)
+    
+    def _discard(self, driver):
+        self._uses.pop(id(driver), None)
+        quit_driver(driver)
+        with self._lock:
+            self._created -= 1
+    
+    def close(self):
+        """Quit every idle session"""
+        while True:
+            try:
+                driver = self._idle.get_nowait()
+            except queue.Empty:
+                break
+            self._discard(driver)
+    
+    def __enter__(self):
+        return self
     
-    # Open file in append mode
-    with open(error_log_path, mode='a', newline='', encoding='utf-8') as file:
-        writer = csv.DictWriter(file, fieldnames=row_data.keys())
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+def snapshot_downloads(download_dir):
+    """Map each CSV already in download_dir to its modification time"""
+    snapshot = {}
+    for path in glob.glob(os.path.join(download_dir, "*.csv")):
+        try:
+            snapshot[path] = os.path.getmtime(path)
+        except OSError:
+            pass
+    return snapshot
+
+def stray_downloads(download_dir):
+    """CSVs and partial downloads in download_dir, which should be empty before a worker clicks download"""
+    try:
+        entries = os.listdir(download_dir)
+    except FileNotFoundError:
+        return []
+    return [os.path.join(download_dir, name) for name in entries
+            if name.lower().endswith(".csv") or name.endswith(PARTIAL_DOWNLOAD_SUFFIXES)]
+
+def quarantine_downloads(download_dir):
+    """
+    Move everything stray_downloads finds into download_dir/stray, so a late
+    download from a failed image is never credited to the next one. Call it
+    only once the browser that downloads there has been quit.
+    """
+    strays = stray_downloads(download_dir)
+    if not strays:
+        return []
+    stray_dir = os.path.join(download_dir, "stray")
+    os.makedirs(stray_dir, exist_ok=True)
+    stamp = datetime.now().strftime("%Y%m%d_%H%M%S_%f")
+    moved = []
+    for path in strays:
+        target = os.path.join(stray_dir, f"{stamp}_{os.path.basename(path)}")
+        try:
+            shutil.move(path, target)
+            moved.append(target)
+        except OSError as e:
+            print(f"Could not quarantine {path}: {e}")
+    print(f"Quarantined {len(moved)} stray download(s) from {download_dir}")
+    return moved
+
+def wait_for_download(download_dir, before, timeout=60, poll_interval=0.1):
+    """
+    Wait until a finished CSV that is not in the `before` snapshot appears in download_dir.
+
+    A CSV counts as finished once the browser has no partial file
+    (e.g. name.csv.crdownload) for it. Returns the path of the newest such
+    file, or raises TimeoutError.
+    """
+    deadline = time.perf_counter() + timeout
+    while True:
+        try:
+            entries = os.listdir(download_dir)
+        except FileNotFoundError:
+            entries = []
+        
+        partial = set()
+        for name in entries:
+            for suffix in PARTIAL_DOWNLOAD_SUFFIXES:
+                if name.endswith(suffix):
+                    partial.add(name[:-len(suffix)])
         
-        # Write header if file is being created
+        finished = {}
+        for name in entries:
+            if not name.lower().endswith(".csv") or name in partial:
+                continue
+            path = os.path.join(download_dir, name)
+            try:
+                mtime = os.path.getmtime(path)
+            except OSError:
+                continue
+            if before.get(path) != mtime:
+                finished[path] = mtime
+        
+        if finished:
+            return max(finished, key=finished.get)
+        if time.perf_counter() >= deadline:
+            raise TimeoutError(f"No finished CSV download appeared in {download_dir} within {timeout} seconds")
+        time.sleep(poll_interval)
+
+def write_stage_timings(records, timings_path=STAGE_TIMINGS_PATH):
+    """Append per-image stage timings (seconds) to a CSV log"""
+    if not records:
+        return
+    file_exists = os.path.isfile(timings_path)
+    with open(timings_path, mode='a', newline='', encoding='utf-8') as file:
+        writer = csv.DictWriter(file, fieldnames=['Timestamp', 'Image_Name', 'Success'] + list(TIMED_STAGES))
         if not file_exists:
             writer.writeheader()
-        
-        # Write the error data
-        writer.writerow(row_data)
+        timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        for record in records:
+            row = {'Timestamp': timestamp, 'Image_Name': os.path.basename(record['image_path']), 'Success': record['success']}
+            row.update({stage: f"{seconds:.3f}" for stage, seconds in record['timings'].items()})
+            writer.writerow(row)
+
+def print_stage_summary(records):
+    """Print the mean time spent in each stage across the processed images"""
+    totals = {}
+    for record in records:
+        for stage, seconds in record['timings'].items():
+            totals.setdefault(stage, []).append(seconds)
+    if not totals:
+        return
+    print("Mean time per stage:")
+    for stage, values in totals.items():
+        print(f"  {stage}: {sum(values) / len(values):.2f}s over {len(values)} images")
+
+class StageTimer:
+    """Records the seconds spent in each of TIMED_STAGES for one image; .stage is the stage in progress"""
+    def __init__(self, timings, stage):
+        self.timings = timings
+        self.stage = stage
+        self.started = time.perf_counter()
+        self._stage_start = self.started
+    
+    def end_stage(self, name):
+        now = time.perf_counter()
+        self.timings[name] = now - self._stage_start
+        self._stage_start = now
+        self.stage = TIMED_STAGES[TIMED_STAGES.index(name) + 1]
     
-    print(f"Error logged to {error_log_path}")
+    def elapsed(self):
+        return time.perf_counter() - self.started
 
-def automate_graph2table_upload(file_path):
-    # Setup Chrome WebDriver
-    driver = None
+def submit_image(driver, file_path, site_url=GRAPH2TABLE_URL, end_stage=None, journal=None):
+    """
+    Load the upload page, upload file_path and wait until the site has
+    processed it; returns the download button, ready to click.
+
+    end_stage (e.g. StageTimer.end_stage) is called as 'page_load' and
+    'processing' finish.
+    """
+    end_stage = end_stage or (lambda name: None)
+    
+    # Navigate to the website
+    driver.get(site_url)
+    print(f"\nProcessing image: {os.path.basename(file_path)}")
+    print("Navigating to Graph2Table...")
+    
+    # Wait for the page to load
+    wait = WebDriverWait(driver, 20)  # Increased timeout for better reliability
+    
+    # Find the hidden file input element
+    file_input = wait.until(
+        EC.presence_of_element_located((By.CSS_SELECTOR, "input[type='file']"))
+    )
+    
+    end_stage('page_load')
     
+    # Sometimes file inputs are hidden - make it visible with JavaScript if needed
+    driver.execute_script("arguments[0].style.display = 'block';", file_input)
+    
+    # Send the file path to the input
+    print(f"Uploading file: {file_path}")
+    file_input.send_keys(file_path)
+    if journal:
+        journal.mark(file_path, 'uploaded')
+    
+    # Wait for the file to be processed
+    print("File uploaded, waiting for processing...")
+    
+    # Try to find the download button with a more robust approach
     try:
-        driver = webdriver.Chrome()
-        
-        # Maximize the browser window to ensure all elements are visible
-        driver.maximize_window()
-        
-        # Navigate to the website
-        driver.get("https://graph2table.com/")
-        print(f"\nProcessing image: {os.path.basename(file_path)}")
-        print("Navigating to Graph2Table...")
-        
-        # Wait for the page to load
-        wait = WebDriverWait(driver, 20)  # Increased timeout for better reliability
-        
-        # Find the hidden file input element
-        file_input = wait.until(
-            EC.presence_of_element_located((By.CSS_SELECTOR, "input[type='file']"))
+        # Wait for the download button to be present in the DOM
+        download_button = wait.until(
+            EC.presence_of_element_located((By.ID, "downloadBtn"))
         )
         
-        # Sometimes file inputs are hidden - make it visible with JavaScript if needed
-        driver.execute_script("arguments[0].style.display = 'block';", file_input)
-        
-        # Send the file path to the input
-        print(f"Uploading file: {file_path}")
-        file_input.send_keys(file_path)
+        # Scroll to the button to ensure it's in view
+        driver.execute_script("arguments[0].scrollIntoView(true);", download_button)
         
-        # Wait for the file to be processed
-        print("File uploaded, waiting for processing...")
+        # Now wait for it to be clickable
+        download_button = wait.until(
+            EC.element_to_be_clickable((By.ID, "downloadBtn"))
+        )
+    except Exception as e:
+        print(f"Error with download button: {e}")
+        print("Trying alternative approach...")
         
-        # Try to find the download button with a more robust approach
+        # Try finding by XPath or other selectors if ID fails
         try:
-            # Wait for the download button to be present in the DOM
             download_button = wait.until(
-                EC.presence_of_element_located((By.ID, "downloadBtn"))
+                EC.element_to_be_clickable((By.XPATH, "//button[contains(., 'Download') or contains(@class, 'download')]"))
             )
-            
-            # Scroll to the button to ensure it's in view
             driver.execute_script("arguments[0].scrollIntoView(true);", download_button)
-            time.sleep(1)  # Short pause to allow scrolling to complete
-            
-            # Now wait for it to be clickable
-            download_button = wait.until(
-                EC.element_to_be_clickable((By.ID, "downloadBtn"))
-            )
-            
-            print("Processing complete, clicking download button...")
-            # Try direct click first
-            try:
-                download_button.click()
-            except:
-                # If direct click fails, try JavaScript click
-                driver.execute_script("arguments[0].click();", download_button)
-                
-        except Exception as e:
-            print(f"Error with download button: {e}")
-            print("Trying alternative approach...")
-            
-            # Try finding by XPath or other selectors if ID fails
-            try:
-                download_button = wait.until(
-                    EC.element_to_be_clickable((By.XPATH, "//button[contains(., 'Download') or contains(@class, 'download')]"))
-                )
-                driver.execute_script("arguments[0].scrollIntoView(true);", download_button)
-                driver.execute_script("arguments[0].click();", download_button)
-            except Exception as inner_e:
-                print(f"Alternative approach also failed: {inner_e}")
-                raise
+        except Exception as inner_e:
+            print(f"Alternative approach also failed: {inner_e}")
+            raise
+    end_stage('processing')
+    return download_button
+
+def click_download(driver, download_button, watch_dir):
+    """Click the download button; returns the snapshot of watch_dir taken just before, for wait_for_download"""
+    # Remember what is already in the download directory so only the new file is picked up
+    before = snapshot_downloads(watch_dir)
+    print("Processing complete, clicking download button...")
+    # Try direct click first
+    try:
+        download_button.click()
+    except:
+        # If direct click fails, try JavaScript click
+        driver.execute_script("arguments[0].click();", download_button)
+    return before
+
+def automate_graph2table_upload(file_path, driver=None, download_dir=None, site_url=GRAPH2TABLE_URL,
+                                download_timeout=60, timings=None, cache_dir=None, journal=None,
+                                output_dir=TARGET_CSV_DIR):
+    """
+    Upload one image to Graph2Table and download the resulting CSV.
+
+    If a driver is given (e.g. from a DriverPool) it is reused and left open;
+    otherwise a fresh browser is started and closed for this image.
+    download_dir must be the directory the browser saves downloads to; it
+    defaults to the shared Downloads folder. site_url can point at a local
+    stand-in page (see graph2table_stub.py) for testing; point output_dir,
+    where the renamed CSV is written, somewhere else for such runs too.
+
+    Completion is detected by watching the download directory for a finished
+    CSV, up to download_timeout seconds. A result that fails
+    validate_result_csv is renamed to *.csv.invalid and counts as a failure,
+    as in run_pipeline(). If a timings dict is passed, the seconds spent in
+    each stage are recorded in it. If cache_dir is given the result is stored
+    in the digitization cache. If a RunJournal is given the image's progress
+    (uploaded, downloaded, renamed or failed) is recorded in it.
+    """
+    timings = {} if timings is None else timings
+    
+    # Setup Chrome WebDriver
+    owns_driver = driver is None
+    # Tracks the stage in progress, reported with any error
+    timer = StageTimer(timings, 'browser_start' if owns_driver else 'page_load')
+    
+    def record_failure(error_type, e):
+        log_error(file_path, error_type, exc=e, stage=timer.stage, elapsed=timer.elapsed())
+        if journal:
+            journal.mark(file_path, 'failed', reason=f"{error_type} during {timer.stage}: {describe_exception(e)}")
+    watch_dir = download_dir or DOWNLOADS_DIR
+    
+    try:
+        if owns_driver:
+            driver = create_driver(download_dir)
+            timer.end_stage('browser_start')
+        
+        download_button = submit_image(driver, file_path, site_url, timer.end_stage, journal)
+        # In a worker's own directory anything left over belongs to another image
+        if download_dir is not None and stray_downloads(download_dir):
+            raise RuntimeError(f"Refusing to download: {download_dir} still holds {stray_downloads(download_dir)}")
+        before = click_download(driver, download_button, watch_dir)
         
-        # Give time for the download to start
+        # Wait for the browser to finish writing the file
         print("Download initiated, waiting for download to complete...")
-        time.sleep(5)
+        try:
+            downloaded_file = wait_for_download(watch_dir, before, timeout=download_timeout)
+        except TimeoutError as e:
+            print(f"Download did not complete: {e}")
+            record_failure("Download Timeout", e)
+            return False
+        timer.end_stage('download')
+        if journal:
+            journal.mark(file_path, 'downloaded')
         
-        print("Download should be complete")
+        print("Download complete")
         
         # Process the downloaded file
         try:
-            process_downloaded_file(file_path)
+            output_path = process_downloaded_file(file_path, download_dir, downloaded_file, output_dir)
+            if output_path is None:
+                raise RuntimeError(f"Downloaded file {downloaded_file} could not be moved into place")
+            # Don't cache or journal an empty or header-only result as a success
+            try:
+                validate_result_csv(output_path)
+            except Exception as e:
+                print(f"Invalid result for {os.path.basename(file_path)}: {e}")
+                os.replace(output_path, output_path + ".invalid")
+                record_failure("CSV Validation Error", e)
+                return False
+            if cache_dir:
+                cache_store(file_path, output_path, site_url, cache_dir)
+            timer.end_stage('post_process')
+            if journal:
+                journal.mark(file_path, 'renamed', output_csv=output_path)
         except Exception as e:
-            error_msg = str(e)
-            print(f"Error processing downloaded file: {error_msg}")
-            log_error_to_csv(file_path, "CSV Processing Error", error_msg)
+            print(f"Error processing downloaded file: {e}")
+            record_failure("CSV Processing Error", e)
             return False
             
     except Exception as e:
-        error_msg = str(e)
-        print(f"An error occurred: {error_msg}")
+        print(f"An error occurred: {e}")
         print("Try checking if the file path exists and is accessible.")
-        log_error_to_csv(file_path, "Browser Automation Error", error_msg)
+        record_failure("Browser Automation Error", e)
         return False
     finally:
-        # Properly close the browser with error handling
-        if driver:
-            try:
-                driver.quit()
-                print("Browser closed successfully")
-            except Exception as e:
-                print(f"Error closing browser: {e}")
-                # If normal quit fails, try more aggressive termination
-                try:
-                    driver.close()
-                    print("Browser tab closed")
-                except:
-                    print("Could not close browser normally")
+        # Properly close the browser with error handling, unless it belongs to a pool
+        if owns_driver and driver:
+            quit_driver(driver)
+        timings['total'] = timer.elapsed()
     
     return True  # If we reach here, processing was successful
 
-def process_downloaded_file(image_path):
-    """Process the downloaded CSV file by moving and renaming it"""
-    try:
-        # Create target directory if it doesn't exist
-        target_dir = r"C:\Users\clint\Desktop\Lifecycle_RA\Data\cropped_sorted_csvs"
-        os.makedirs(target_dir, exist_ok=True)
-        
-        # Get the download directory (specific Downloads folder)
-        downloads_dir = r"C:\Users\clint\Downloads"
-        
-        # Find the most recently downloaded CSV file
-        csv_files = glob.glob(os.path.join(downloads_dir, "*.csv"))
-        if not csv_files:
-            print("No CSV files found in the Downloads directory.")
-            return
-        
-        # Get the most recent file
-        latest_file = max(csv_files, key=os.path.getmtime)
-        print(f"Found downloaded CSV: {latest_file}")
-        
-        # Extract the base name from the image path
-        image_name = os.path.basename(image_path)
-        
-        # Use regex to extract XX_YYYY pattern from the filename
-        match = re.search(r'(\d+_\d+)', image_name)
-        if match:
-            base_name = match.group(1)
-        else:
-            # Fallback if the pattern isn't found
-            base_name = os.path.splitext(image_name)[0]
-            print(f"Warning: Could not extract pattern from filename. Using {base_name} instead.")
-        
+def save_result_csv(image_path, source_csv, move=False, output_dir=TARGET_CSV_DIR):
+    """Copy (or move) a digitized CSV into output_dir, named after the image's XX_YYYY pattern; returns the new path"""
+    # Create target directory if it doesn't exist
+    os.makedirs(output_dir, exist_ok=True)
+    
+    # Extract the base name from the image path
+    image_name = os.path.basename(image_path)
+    
+    # Use regex to extract XX_YYYY pattern from the filename
+    match = re.search(r'(\d+_\d+)', image_name)
+    if match:
+        base_name = match.group(1)
+    else:
+        # Fallback if the pattern isn't found
+        base_name = os.path.splitext(image_name)[0]
+        print(f"Warning: Could not extract pattern from filename. Using {base_name} instead.")
+    
+    with _target_name_lock:
         # Check if file with this name already exists and add counter if needed
         counter = 1
         new_filename = f"{base_name}.csv"
-        full_path = os.path.join(target_dir, new_filename)
+        full_path = os.path.join(output_dir, new_filename)
         
         while os.path.exists(full_path):
             counter += 1
             new_filename = f"{base_name}_{counter}.csv"
-            full_path = os.path.join(target_dir, new_filename)
+            full_path = os.path.join(output_dir, new_filename)
         
         # Copy the file to the new location with the new name
-        shutil.copy2(latest_file, full_path)
-        print(f"File renamed and moved to: {full_path}")
+        if move:
+            shutil.move(source_csv, full_path)
+        else:
+            shutil.copy2(source_csv, full_path)
+    print(f"File renamed and moved to: {full_path}")
+    return full_path
+
+def process_downloaded_file(image_path, downloads_dir=None, downloaded_file=None, output_dir=TARGET_CSV_DIR):
+    """
+    Process the downloaded CSV file by moving and renaming it; returns the new path
+
+    downloaded_file is the CSV found by wait_for_download; without it the
+    newest CSV in the download directory is used. With the shared Downloads
+    folder the file is copied. A worker's own download directory only ever
+    holds this image's result, so the file is moved out to leave the
+    directory empty for the next image.
+    """
+    try:
+        # Get the download directory (specific Downloads folder unless a worker has its own)
+        isolated = downloads_dir is not None
+        if not isolated:
+            downloads_dir = DOWNLOADS_DIR
+        
+        if downloaded_file is not None:
+            latest_file = downloaded_file
+        else:
+            # Find the most recently downloaded CSV file
+            csv_files = glob.glob(os.path.join(downloads_dir, "*.csv"))
+            if not csv_files:
+                print("No CSV files found in the Downloads directory.")
+                return None
+            
+            # Get the most recent file
+            latest_file = max(csv_files, key=os.path.getmtime)
+        print(f"Found downloaded CSV: {latest_file}")
+        
+        return save_result_csv(image_path, latest_file, move=isolated, output_dir=output_dir)
     except Exception as e:
         print(f"An error occurred while processing the file: {e}")
+        return None
+
+def validate_result_csv(csv_path):
+    """
+    Raise ValueError unless csv_path looks like a digitized chart: a header
+    with a label column and at least one value column, and at least one
+    data row with a numeric value
+    """
+    with open(csv_path, 'r', newline='', encoding='utf-8-sig') as f:
+        rows = [row for row in csv.reader(f) if any(cell.strip() for cell in row)]
+    name = os.path.basename(csv_path)
+    if len(rows) < 2:
+        raise ValueError(f"{name} has no data rows")
+    if len(rows[0]) < 2:
+        raise ValueError(f"{name} has no value columns (header: {rows[0]})")
+    for row in rows[1:]:
+        for cell in row[1:]:
+            try:
+                float(cell.replace('$', '').replace(',', ''))
+                return
+            except ValueError:
+                continue
+    raise ValueError(f"{name} has no numeric values")
+
+def cache_key(image_hash, site_url=GRAPH2TABLE_URL):
+    """
+    Cache file name for an image hash digitized by site_url: the bare hash for
+    Graph2Table itself, the hash plus a digest of the URL for anything else
+    (e.g. graph2table_stub.py), so stand-in results never replace real ones
+    """
+    if site_url == GRAPH2TABLE_URL:
+        return image_hash
+    return f"{image_hash}_{hashlib.sha256(site_url.encode('utf-8')).hexdigest()[:12]}"
+
+def cache_lookup(image_hash, cache_dir=CACHE_DIR, site_url=GRAPH2TABLE_URL):
+    """Return the cache metadata for an image hash digitized by site_url (with its cached 'csv_path'), or None on a miss"""
+    key = cache_key(image_hash, site_url)
+    csv_path = os.path.join(cache_dir, f"{key}.csv")
+    meta_path = os.path.join(cache_dir, f"{key}.json")
+    if not (os.path.isfile(csv_path) and os.path.isfile(meta_path)):
+        return None
+    try:
+        with open(meta_path, 'r', encoding='utf-8') as f:
+            entry = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if entry.get('site_url') != site_url:
+        return None
+    entry['csv_path'] = csv_path
+    return entry
+
+def _write_cache_metadata(entry, cache_dir):
+    meta = {key: value for key, value in entry.items() if key != 'csv_path'}
+    meta_path = os.path.join(cache_dir, f"{cache_key(entry['image_hash'], entry['site_url'])}.json")
+    tmp_path = meta_path + ".tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(meta, f, indent=2)
+    os.replace(tmp_path, meta_path)
+
+def cache_store(image_path, result_csv, site_url=GRAPH2TABLE_URL, cache_dir=CACHE_DIR):
+    """Store a digitized CSV in the cache under the image's content hash and site_url"""
+    os.makedirs(cache_dir, exist_ok=True)
+    image_hash = file_content_hash(image_path)
+    csv_path = os.path.join(cache_dir, f"{cache_key(image_hash, site_url)}.csv")
+    
+    # Copy to a temporary name first so a half-written file is never seen as a hit
+    tmp_path = csv_path + ".tmp"
+    shutil.copy2(result_csv, tmp_path)
+    os.replace(tmp_path, csv_path)
+    
+    entry = {
+        'image_hash': image_hash,
+        'image_name': os.path.basename(image_path),
+        'image_path': image_path,
+        'csv_hash': file_content_hash(csv_path),
+        'site_url': site_url,
+        'cached_at': datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+        # Where the result was written for each image with this content
+        'outputs': {os.path.basename(image_path): result_csv},
+    }
+    _write_cache_metadata(entry, cache_dir)
+    return entry
+
+def cache_restore(image_path, entry, cache_dir=CACHE_DIR, output_dir=TARGET_CSV_DIR):
+    """
+    Put a cached CSV in output_dir for image_path; returns its path.
+
+    If this image's earlier output is still in place in output_dir with the
+    cached content, nothing is copied, so re-runs don't create duplicate CSVs.
+    """
+    image_name = os.path.basename(image_path)
+    previous = entry.get('outputs', {}).get(image_name)
+    if (previous and os.path.isfile(previous)
+            and os.path.normcase(os.path.abspath(os.path.dirname(previous))) == os.path.normcase(os.path.abspath(output_dir))
+            and file_content_hash(previous) == entry.get('csv_hash')):
+        print(f"Cache hit for {image_name}, result already at {previous}")
+        return previous
+    
+    print(f"Cache hit for {image_name}")
+    full_path = save_result_csv(image_path, entry['csv_path'], output_dir=output_dir)
+    entry.setdefault('outputs', {})[image_name] = full_path
+    _write_cache_metadata(entry, cache_dir)
+    return full_path
+
+def invalidate_cache(image_paths=None, cache_dir=CACHE_DIR):
+    """
+    Remove cached results for the given images (from every site_url), or
+    every cached result if image_paths is None.
+
+    Returns the number of entries removed.
+    """
+    if not os.path.isdir(cache_dir):
+        return 0
+    keys = {os.path.splitext(name)[0] for name in os.listdir(cache_dir) if name.endswith('.json')}
+    if image_paths is not None:
+        hashes = {file_content_hash(path) for path in image_paths}
+        keys = {key for key in keys if key.split('_', 1)[0] in hashes}
+    
+    removed = 0
+    for key in keys:
+        found = False
+        for ext in ('.csv', '.json'):
+            path = os.path.join(cache_dir, key + ext)
+            if os.path.isfile(path):
+                os.remove(path)
+                found = True
+        removed += found
+    print(f"Removed {removed} cached result(s) from {cache_dir}")
+    return removed
+
+def process_image(image_path, driver=None, download_dir=None, site_url=GRAPH2TABLE_URL,
+                  download_timeout=60, timings=None, cache_dir=None, journal=None, output_dir=TARGET_CSV_DIR):
+    """Digitize one image, logging unexpected errors; returns True on success"""
+    try:
+        result = automate_graph2table_upload(image_path, driver=driver, download_dir=download_dir, site_url=site_url,
+                                             download_timeout=download_timeout, timings=timings, cache_dir=cache_dir,
+                                             journal=journal, output_dir=output_dir)
+        if result:
+            print(f"Successfully processed: {os.path.basename(image_path)}")
+        else:
+            print(f"Failed to fully process: {os.path.basename(image_path)}")
+        return result
+    except Exception as e:
+        print(f"Failed to process {os.path.basename(image_path)}: {e}")
+        log_error(image_path, "Unexpected Error", exc=e)
+        if journal:
+            journal.mark(image_path, 'failed', reason=f"Unexpected Error: {describe_exception(e)}")
+        return False
+
+def browser_start_failed(image_path, e, journal=None):
+    """Log a browser that could not be started for image_path and return its failure record"""
+    log_error(image_path, "Browser Automation Error", exc=e, stage='browser_start')
+    if journal:
+        journal.mark(image_path, 'failed', reason=f"Browser Automation Error during browser_start: {describe_exception(e)}")
+    return {'image_path': image_path, 'success': False, 'timings': {}}
+
+def digitization_worker(worker_id, image_queue, download_dir, site_url=GRAPH2TABLE_URL, download_timeout=60,
+                        cache_dir=None, journal=None, output_dir=TARGET_CSV_DIR):
+    """
+    Take images off image_queue until it is empty, using one browser whose downloads go to download_dir.
+
+    Returns a list of {'image_path', 'success', 'timings'} records.
+    """
+    results = []
+    # A pool of one gives this worker health checks and crash replacement
+    pool = DriverPool(size=1, driver_factory=lambda: create_driver(download_dir))
+    try:
+        while True:
+            try:
+                image_path = image_queue.get_nowait()
+            except queue.Empty:
+                break
+            print(f"[worker {worker_id}] {os.path.basename(image_path)}")
+            try:
+                driver = pool.acquire()
+            except Exception as e:
+                print(f"[worker {worker_id}] Could not start browser: {e}")
+                results.append(browser_start_failed(image_path, e, journal))
+                continue
+            timings = {}
+            success = False
+            try:
+                success = process_image(image_path, driver=driver, download_dir=download_dir, site_url=site_url,
+                                        download_timeout=download_timeout, timings=timings, cache_dir=cache_dir,
+                                        journal=journal, output_dir=output_dir)
+                results.append({'image_path': image_path, 'success': success, 'timings': timings})
+            finally:
+                # After a failure the browser may still be downloading this image's CSV:
+                # quit it to cancel that, then clear the directory for the next image
+                pool.release(driver, discard=not success)
+                if not success:
+                    quarantine_downloads(download_dir)
+    finally:
+        pool.close()
+    return results
 
-def process_all_images(image_paths=None):
-    """Process specified images or all images in the Sorted_Images directory"""
+def digitize_batch(image_paths, pool_size=0, workers=1, download_root=None, site_url=GRAPH2TABLE_URL,
+                   download_timeout=60, cache_dir=None, journal=None, output_dir=TARGET_CSV_DIR):
+    """Upload every image once (see process_all_images); returns one record per image"""
+    records = []
+    if workers > 1:
+        if download_root is None:
+            download_root = os.path.join(DOWNLOADS_DIR, "graph2table_workers")
+        image_queue = queue.Queue()
+        for image_path in image_paths:
+            image_queue.put(image_path)
+
+        print(f"Processing with {workers} concurrent browser workers")
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            futures = [
+                executor.submit(digitization_worker, worker_id, image_queue,
+                                os.path.join(download_root, f"worker_{worker_id}"), site_url, download_timeout,
+                                cache_dir, journal, output_dir)
+                for worker_id in range(1, workers + 1)
+            ]
+            for future in futures:
+                records.extend(future.result())
+    else:
+        pool = DriverPool(size=pool_size) if pool_size > 0 else None
+
+        # Process each image
+        for image_path in image_paths:
+            if pool is not None:
+                try:
+                    driver = pool.acquire()
+                except Exception as e:
+                    print(f"Could not start browser: {e}")
+                    records.append(browser_start_failed(image_path, e, journal))
+                    continue
+                timings = {}
+                result = False
+                try:
+                    result = process_image(image_path, driver=driver, site_url=site_url,
+                                           download_timeout=download_timeout, timings=timings, cache_dir=cache_dir,
+                                           journal=journal, output_dir=output_dir)
+                finally:
+                    # Quit a session that failed so a late download can't land during the next image
+                    pool.release(driver, discard=not result)
+            else:
+                timings = {}
+                result = process_image(image_path, site_url=site_url, download_timeout=download_timeout, timings=timings,
+                                       cache_dir=cache_dir, journal=journal, output_dir=output_dir)
+            records.append({'image_path': image_path, 'success': result, 'timings': timings})
+
+        if pool is not None:
+            pool.close()
+    return records
+
+def pipeline_failure(image_path, error_type, exc, timer, journal=None):
+    """Log a failed pipeline stage for image_path and return its failure record"""
+    log_error(image_path, error_type, exc=exc, stage=timer.stage, elapsed=timer.elapsed())
+    if journal:
+        journal.mark(image_path, 'failed', reason=f"{error_type} during {timer.stage}: {describe_exception(exc)}")
+    timer.timings['total'] = timer.elapsed()
+    return {'image_path': image_path, 'success': False, 'timings': timer.timings}
+
+async def run_pipeline(image_paths, browsers=1, queue_size=4, download_root=None, site_url=GRAPH2TABLE_URL,
+                       download_timeout=60, cache_dir=None, journal=None, output_dir=TARGET_CSV_DIR):
+    """
+    Digitize image_paths as a pipeline of stages joined by bounded queues:
+
+        submit + await result (one lane per browser) -> move/rename -> validate
+
+    Every blocking call (Selenium, download polling, file moves, hashing)
+    runs in an executor, so while a browser uploads image N+1 the CSV of
+    image N is being moved, validated and cached. Submitting and awaiting
+    the result stay in one lane per browser: navigating to the next upload
+    before the download has landed can cancel it. Each lane downloads into
+    its own download_root/worker_<n> directory and only clicks download once
+    the previous result has been moved out of it.
+
+    Results are renamed into output_dir. CSVs that fail validation are
+    renamed to *.csv.invalid so they are not picked up as data. Returns one
+    {'image_path', 'success', 'timings'} record per image. From a script use
+    digitize_pipeline(); in a notebook, await this directly.
+    """
+    if download_root is None:
+        download_root = os.path.join(DOWNLOADS_DIR, "graph2table_workers")
+    loop = asyncio.get_running_loop()
+    image_queue = asyncio.Queue(maxsize=queue_size)
+    downloaded_queue = asyncio.Queue(maxsize=queue_size)
+    moved_queue = asyncio.Queue(maxsize=queue_size)
+    records = []
+    
+    # One thread per browser, so a lane's blocking calls never wait on another lane
+    browser_executor = ThreadPoolExecutor(max_workers=browsers, thread_name_prefix="browser")
+    file_executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix="postprocess")
+    
+    def run(executor, func, *args, **kwargs):
+        return loop.run_in_executor(executor, functools.partial(func, *args, **kwargs))
+    
+    async def feed_images():
+        for image_path in image_paths:
+            await image_queue.put(image_path)
+        for _ in range(browsers):
+            await image_queue.put(None)
+    
+    async def browser_lane(lane_id):
+        download_dir = os.path.join(download_root, f"worker_{lane_id}")
+        pool = DriverPool(size=1, driver_factory=lambda: create_driver(download_dir))
+        # Set while download_dir holds no result waiting to be moved out
+        dir_clear = asyncio.Event()
+        dir_clear.set()
+        try:
+            while True:
+                image_path = await image_queue.get()
+                if image_path is None:
+                    break
+                print(f"[browser {lane_id}] {os.path.basename(image_path)}")
+                try:
+                    driver = await run(browser_executor, pool.acquire)
+                except Exception as e:
+                    print(f"[browser {lane_id}] Could not start browser: {e}")
+                    records.append(browser_start_failed(image_path, e, journal))
+                    continue
+                timer = StageTimer({}, 'page_load')
+                failed = True
+                try:
+                    download_button = await run(browser_executor, submit_image, driver, image_path, site_url,
+                                                timer.end_stage, journal)
+                    # Only one result at a time in the lane's directory, so each CSV maps to its image
+                    await dir_clear.wait()
+                    strays = await run(browser_executor, stray_downloads, download_dir)
+                    if strays:
+                        raise RuntimeError(f"Refusing to download: {download_dir} still holds {strays}")
+                    before = await run(browser_executor, click_download, driver, download_button, download_dir)
+                    try:
+                        downloaded_file = await run(browser_executor, wait_for_download, download_dir, before,
+                                                    timeout=download_timeout)
+                    except TimeoutError as e:
+                        print(f"Download did not complete: {e}")
+                        records.append(pipeline_failure(image_path, "Download Timeout", e, timer, journal))
+                        continue
+                    timer.end_stage('download')
+                    if journal:
+                        journal.mark(image_path, 'downloaded')
+                    failed = False
+                except Exception as e:
+                    print(f"An error occurred: {e}")
+                    records.append(pipeline_failure(image_path, "Browser Automation Error", e, timer, journal))
+                    continue
+                finally:
+                    # A failed image's download may still be in flight: quit the browser to cancel it,
+                    # then, once the previous result has been moved out, clear the directory
+                    await run(browser_executor, pool.release, driver, discard=failed)
+                    if failed:
+                        await dir_clear.wait()
+                        await run(browser_executor, quarantine_downloads, download_dir)
+                dir_clear.clear()
+                await downloaded_queue.put((image_path, download_dir, downloaded_file, timer, dir_clear))
+        finally:
+            await run(browser_executor, pool.close)
+    
+    async def browser_stage():
+        await asyncio.gather(*(browser_lane(lane_id) for lane_id in range(1, browsers + 1)))
+        await downloaded_queue.put(None)
+    
+    async def move_stage():
+        while True:
+            item = await downloaded_queue.get()
+            if item is None:
+                break
+            image_path, download_dir, downloaded_file, timer, dir_clear = item
+            started = time.perf_counter()
+            output_path = await run(file_executor, process_downloaded_file, image_path, download_dir, downloaded_file,
+                                    output_dir)
+            if output_path is None:
+                # Don't leave a result that could not be moved for the lane's next image
+                await run(file_executor, quarantine_downloads, download_dir)
+            dir_clear.set()
+            if output_path is None:
+                e = RuntimeError(f"Downloaded file {downloaded_file} could not be moved into place")
+                records.append(pipeline_failure(image_path, "CSV Processing Error", e, timer, journal))
+                continue
+            timer.timings['post_process'] = time.perf_counter() - started
+            await moved_queue.put((image_path, output_path, timer))
+        await moved_queue.put(None)
+    
+    async def validate_stage():
+        while True:
+            item = await moved_queue.get()
+            if item is None:
+                break
+            image_path, output_path, timer = item
+            started = time.perf_counter()
+            try:
+                await run(file_executor, validate_result_csv, output_path)
+            except Exception as e:
+                print(f"Invalid result for {os.path.basename(image_path)}: {e}")
+                await run(file_executor, os.replace, output_path, output_path + ".invalid")
+                records.append(pipeline_failure(image_path, "CSV Validation Error", e, timer, journal))
+                continue
+            try:
+                if cache_dir:
+                    await run(file_executor, cache_store, image_path, output_path, site_url, cache_dir)
+            except Exception as e:
+                records.append(pipeline_failure(image_path, "CSV Processing Error", e, timer, journal))
+                continue
+            timer.timings['post_process'] += time.perf_counter() - started
+            timer.timings['total'] = timer.elapsed()
+            if journal:
+                journal.mark(image_path, 'renamed', output_csv=output_path)
+            print(f"Successfully processed: {os.path.basename(image_path)}")
+            records.append({'image_path': image_path, 'success': True, 'timings': timer.timings})
+    
+    with browser_executor, file_executor:
+        await asyncio.gather(feed_images(), browser_stage(), move_stage(), validate_stage())
+    return records
+
+def digitize_pipeline(image_paths, browsers=1, queue_size=4, download_root=None, site_url=GRAPH2TABLE_URL,
+                      download_timeout=60, cache_dir=None, journal=None, output_dir=TARGET_CSV_DIR):
+    """Run run_pipeline() to completion from synchronous code; returns one record per image"""
+    return asyncio.run(run_pipeline(image_paths, browsers, queue_size, download_root, site_url, download_timeout,
+                                    cache_dir, journal, output_dir))
+
+def process_all_images(image_paths=None, pool_size=0, workers=1, download_root=None, site_url=GRAPH2TABLE_URL,
+                       download_timeout=60, timings_path=STAGE_TIMINGS_PATH, use_cache=True, cache_dir=CACHE_DIR,
+                       journal_path=JOURNAL_PATH, resume=False, retries=0, retry_backoff=30, pipeline=False,
+                       queue_size=4, output_dir=TARGET_CSV_DIR):
+    """
+    Process specified images or all images in the Sorted_Images directory
+
+    With pool_size > 0 browser sessions are taken from a DriverPool and reused
+    across images instead of starting a new browser for every upload.
+
+    With workers > 1 images are digitized concurrently by that many browsers.
+    Each worker downloads into its own download_root/worker_<n> directory, so
+    every CSV maps unambiguously to the image that produced it.
+
+    Renamed CSVs are written to output_dir; point it (and the journal, timings
+    and cache) elsewhere when testing against graph2table_stub.py so stand-in
+    results never mix with the real data in TARGET_CSV_DIR.
+
+    Per-image stage timings are appended to timings_path (None to skip) and
+    summarized at the end of the run.
+
+    With use_cache, images whose content hash is already in the digitization
+    cache are served from it without opening a browser, and identical images
+    within the batch are uploaded only once. Use invalidate_cache() to force
+    a re-digitization.
+
+    Each image's progress is recorded in the run journal at journal_path
+    (None to disable). With resume=True images the journal shows as finished,
+    with their CSV still in place, are skipped. With retries > 0 images that
+    fail are retried up to that many more times, waiting retry_backoff
+    seconds before the first retry round and doubling the wait for each
+    further round.
+
+    With pipeline=True uploads go through run_pipeline() instead: `workers`
+    browsers (pool_size is not used) feed moving, validating and caching of
+    the results through queues of queue_size images, so post-processing
+    overlaps with the next upload.
+    """
     if image_paths is None:
         image_directory = r"C:\Users\clint\Desktop\Lifecycle_RA\Data\cropped_sorted"
         images = get_image_files(image_directory)
@@ -225,36 +1019,114 @@ def process_all_images(image_paths=None):
         return
 
     print(f"Found {len(images)} images to process")
+    run_started = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
 
-    # Keep track of success and failure
-    success_count = 0
-    failure_count = 0
+    journal = RunJournal(journal_path) if journal_path else None
+    skipped = 0
+    if journal is not None and resume:
+        done = journal.completed(images)
+        skipped = len(done)
+        images = [image_path for image_path in images if image_path not in done]
+        print(f"Resuming: {skipped} images already finished, {len(images)} remaining")
+    if journal is not None:
+        journal.start_run(images)
 
-    # Process each image
-    for image_path in images:
-        try:
-            result = automate_graph2table_upload(image_path)
-            if result:
-                print(f"Successfully processed: {os.path.basename(image_path)}")
-                success_count += 1
+    # Keep track of each image's outcome and stage timings
+    records = []
+
+    duplicates = []
+    if use_cache:
+        to_upload = []
+        upload_hashes = set()
+        for image_path in images:
+            try:
+                image_hash = file_content_hash(image_path)
+            except OSError as e:
+                print(f"Could not read {os.path.basename(image_path)}: {e}")
+                log_error(image_path, "Unexpected Error", exc=e, stage='cache_lookup')
+                if journal:
+                    journal.mark(image_path, 'failed', reason=f"Unreadable image: {describe_exception(e)}")
+                records.append({'image_path': image_path, 'success': False, 'timings': {}})
+                continue
+            entry = cache_lookup(image_hash, cache_dir, site_url)
+            if entry is not None:
+                output_path = cache_restore(image_path, entry, cache_dir, output_dir)
+                if journal:
+                    journal.mark(image_path, 'renamed', reason="served from cache", output_csv=output_path,
+                                 attempt=False)
+                records.append({'image_path': image_path, 'success': True, 'timings': {}, 'cached': True})
+            elif image_hash in upload_hashes:
+                # Same pixels as an image already queued: reuse its result once it is cached
+                duplicates.append((image_path, image_hash))
             else:
-                print(f"Failed to fully process: {os.path.basename(image_path)}")
-                failure_count += 1
-        except Exception as e:
-            error_msg = str(e)
-            print(f"Failed to process {os.path.basename(image_path)}: {error_msg}")
-            log_error_to_csv(image_path, "Unexpected Error", error_msg)
-            failure_count += 1
-            continue
+                upload_hashes.add(image_hash)
+                to_upload.append(image_path)
+        print(f"{len(records)} served from cache, {len(duplicates)} duplicates, {len(to_upload)} to upload")
+    else:
+        to_upload = images
+        cache_dir = None
+
+    def upload(image_paths):
+        if pipeline:
+            return digitize_pipeline(image_paths, max(workers, 1), queue_size, download_root, site_url,
+                                     download_timeout, cache_dir, journal, output_dir)
+        return digitize_batch(image_paths, pool_size, workers, download_root, site_url, download_timeout,
+                              cache_dir, journal, output_dir)
+
+    upload_records = upload(to_upload)
+    for attempt in range(1, retries + 1):
+        failed = [record['image_path'] for record in upload_records if not record['success']]
+        if not failed:
+            break
+        delay = retry_backoff * 2 ** (attempt - 1)
+        print(f"\nRetry {attempt}/{retries}: {len(failed)} failed images, waiting {delay}s")
+        time.sleep(delay)
+        retried = {record['image_path']: record for record in upload(failed)}
+        upload_records = [retried.get(record['image_path'], record) for record in upload_records]
+    records.extend(upload_records)
+
+    for image_path, image_hash in duplicates:
+        entry = cache_lookup(image_hash, cache_dir, site_url)
+        if entry is not None:
+            output_path = cache_restore(image_path, entry, cache_dir, output_dir)
+            if journal:
+                journal.mark(image_path, 'renamed', reason="served from cache", output_csv=output_path,
+                             attempt=False)
+        else:
+            print(f"Failed to process {os.path.basename(image_path)}: identical image was not digitized")
+            if journal:
+                journal.mark(image_path, 'failed', reason="identical image was not digitized")
+        records.append({'image_path': image_path, 'success': entry is not None, 'timings': {}, 'cached': True})
+
+    ERROR_LOG.flush()
+    success_count = sum(1 for record in records if record['success'])
+    failure_count = len(records) - success_count
+    if timings_path:
+        write_stage_timings(records, timings_path)
 
     # Print summary
     print("\n=== Processing Complete ===")
-    print(f"Total images: {len(images)}")
+    print(f"Total images: {len(images) + skipped}")
+    if skipped:
+        print(f"Skipped (finished in an earlier run): {skipped}")
     print(f"Successfully processed: {success_count}")
     print(f"Failed to process: {failure_count}")
+    if use_cache:
+        print(f"Served from cache: {sum(1 for record in records if record.get('cached'))}")
+    print_stage_summary(records)
+
+    if journal is not None:
+        journal.finish_run(success_count, failure_count)
+        for image_path, attempts, reason in journal.failures():
+            if image_path in images:
+                print(f"  {os.path.basename(image_path)} ({attempts} attempts): {reason}")
+        print(f"Run journal: {journal_path}")
+        journal.close()
 
     if failure_count > 0:
-        print(f"Check the error log at: C:\\Users\\clint\\Desktop\\Lifecycle_RA\\processing_errors.csv")
+        print(f"Check the error log at: {ERROR_LOG_PATH} (queryable in {ERROR_DB_PATH})")
+        for (error_type, stage), count in sorted(ERROR_LOG.summary(run_started).items(), key=lambda item: -item[1]):
+            print(f"  {error_type} [{stage or '-'}]: {count}")
 
 if __name__ == "__main__":
     # Specify the three images to process
@@ -0,0 +1,327 @@
+import os
+import hashlib
+import numpy as np
+import pandas as pd
+
+from processing_data import (OUTPUT_EXTENSIONS, to_typed_frame, write_table, load_table, find_table,
+                             load_combined_data, load_manifest, save_manifest)
+
+COMBINED_DIR = r"C:\Users\clint\Desktop\Lifecycle_RA\Data\Processed\Combined_Csvs"
+
+AGE_COLUMNS = ('2YO', '3YO', '4YO', '5YO')
+
+# Order of the per-column statistics in the stats tables
+STAT_NAMES = ('mean', 'median', 'min', 'max', 'mean_no_extremes', 'median_no_extremes')
+
+# Period column name, pandas period frequency, output table and whether it carries
+# the *_no_outliers statistics (the monthly table never has)
+PERIODS = {
+    'Quarter': ('Q', "combined_stats_quarterly", True),
+    'Month': ('M', "combined_stats_monthly", False),
+}
+
+# Default threshold per outlier method: modified z-score for 'mad', fence
+# multiplier for 'iqr', standard deviations for 'std'
+OUTLIER_THRESHOLDS = {'mad': 3.5, 'iqr': 1.5, 'std': 2.0}
+
+def remove_outliers_2std(series):
+    """Blank out values further than 2 standard deviations from the column mean"""
+    if series.dropna().empty:
+        return series
+    mean = series.mean()
+    std = series.std()
+    return series.where((series >= mean - 2 * std) & (series <= mean + 2 * std))
+
+def grouped_stats(values, codes, n_groups):
+    """
+    Compute every statistic in STAT_NAMES for each (group, column) in one pass.
+
+    values is an (n_rows, n_cols) float array with NaN for missing prices and
+    codes the group number of each row (-1 to ignore the row). The non-NaN
+    values are sorted once by (column, group, value), so every group is a
+    contiguous sorted segment: min/max/medians are index lookups and the
+    sums are bincounts. "No extremes" drops every value equal to the group
+    min or max and is NaN for groups with 2 or fewer values.
+
+    Returns an array of shape (n_groups, n_cols, len(STAT_NAMES)).
+    """
+    values = np.asarray(values, dtype=np.float64)
+    codes = np.asarray(codes)
+    n_cols = values.shape[1]
+    n_seg = n_cols * n_groups
+    result = np.full((n_seg, len(STAT_NAMES)), np.nan)
+
+    rows, cols = np.nonzero(~np.isnan(values) & (codes >= 0)[:, None])
+    if rows.size == 0:
+        return result.reshape(n_cols, n_groups, -1).transpose(1, 0, 2)
+    v = values[rows, cols]
+    seg = cols * n_groups + codes[rows]
+    order = np.lexsort((v, seg))
+    v, seg = v[order], seg[order]
+
+    count = np.bincount(seg, minlength=n_seg)
+    start = np.cumsum(count) - count
+    has = count > 0
+    first = np.where(has, start, 0)
+    last = np.where(has, start + count - 1, 0)
+
+    def median_of(seg_start, seg_count, valid):
+        lo = np.where(valid, seg_start + (seg_count - 1) // 2, 0)
+        hi = np.where(valid, seg_start + seg_count // 2, 0)
+        return np.where(valid, (v[lo] + v[hi]) / 2, np.nan)
+
+    vmin = np.where(has, v[first], np.nan)
+    vmax = np.where(has, v[last], np.nan)
+    result[:, 0] = np.where(has, np.bincount(seg, weights=v, minlength=n_seg) / np.maximum(count, 1), np.nan)
+    result[:, 1] = median_of(start, count, has)
+    result[:, 2] = vmin
+    result[:, 3] = vmax
+
+    # Values equal to the min sit at the front of each sorted segment, so the
+    # trimmed values are the contiguous run after them
+    is_min = v == vmin[seg]
+    keep = ~is_min & (v != vmax[seg])
+    n_min = np.bincount(seg, weights=is_min, minlength=n_seg).astype(np.int64)
+    trimmed = np.bincount(seg, weights=keep, minlength=n_seg).astype(np.int64)
+    valid = (count > 2) & (trimmed > 0)
+    trimmed_sum = np.bincount(seg, weights=np.where(keep, v, 0.0), minlength=n_seg)
+    result[:, 4] = np.where(valid, trimmed_sum / np.maximum(trimmed, 1), np.nan)
+    result[:, 5] = median_of(start + n_min, trimmed, valid)
+
+    return result.reshape(n_cols, n_groups, -1).transpose(1, 0, 2)
+
+def outlier_mask(values, codes, n_groups, method='mad', threshold=None, min_count=3):
+    """
+    Flag outliers within each (group, column) of values, with the same sorted
+    segment layout as grouped_stats. Returns a boolean array shaped like values.
+
+    - 'mad': |0.6745 * (x - median) / MAD| > threshold; when MAD is 0 the mean
+      absolute deviation * 1.2533 stands in for it
+    - 'iqr': outside [Q1 - threshold * IQR, Q3 + threshold * IQR]
+    - 'std': outside mean +/- threshold * std (ddof=1)
+
+    Groups with fewer than min_count values are never flagged.
+    """
+    if method not in OUTLIER_THRESHOLDS:
+        raise ValueError(f"Unknown outlier method '{method}', expected one of {list(OUTLIER_THRESHOLDS)}")
+    if threshold is None:
+        threshold = OUTLIER_THRESHOLDS[method]
+    values = np.asarray(values, dtype=np.float64)
+    codes = np.asarray(codes)
+    mask = np.zeros(values.shape, dtype=bool)
+    n_seg = values.shape[1] * n_groups
+
+    rows, cols = np.nonzero(~np.isnan(values) & (codes >= 0)[:, None])
+    if rows.size == 0:
+        return mask
+    v = values[rows, cols]
+    seg = cols * n_groups + codes[rows]
+    order = np.lexsort((v, seg))
+    v, seg, rows, cols = v[order], seg[order], rows[order], cols[order]
+
+    count = np.bincount(seg, minlength=n_seg)
+    start = np.cumsum(count) - count
+    has = count > 0
+
+    def quantile(sorted_values, q):
+        # Linear interpolation between order statistics, as pandas' quantile does
+        pos = np.where(has, start + (count - 1) * q, 0)
+        lo, hi = np.floor(pos).astype(np.int64), np.ceil(pos).astype(np.int64)
+        return sorted_values[lo] + (sorted_values[hi] - sorted_values[lo]) * (pos - lo)
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        if method == 'mad':
+            median = quantile(v, 0.5)[seg]
+            deviation = np.abs(v - median)
+            mad = quantile(deviation[np.lexsort((deviation, seg))], 0.5)[seg]
+            mean_ad = (np.bincount(seg, weights=deviation, minlength=n_seg) / np.maximum(count, 1))[seg]
+            score = np.where(mad > 0, 0.6745 * (v - median) / mad,
+                             np.where(mean_ad > 0, (v - median) / (1.2533 * mean_ad), 0.0))
+            flagged = np.abs(score) > threshold
+        elif method == 'iqr':
+            q1, q3 = quantile(v, 0.25)[seg], quantile(v, 0.75)[seg]
+            spread = q3 - q1
+            flagged = (v < q1 - threshold * spread) | (v > q3 + threshold * spread)
+        else:
+            mean = np.bincount(seg, weights=v, minlength=n_seg) / np.maximum(count, 1)
+            squares = np.bincount(seg, weights=(v - mean[seg]) ** 2, minlength=n_seg)
+            std = np.sqrt(squares / (count - 1))[seg]
+            flagged = (v < mean[seg] - threshold * std) | (v > mean[seg] + threshold * std)
+
+    mask[rows, cols] = flagged & (count[seg] >= min_count)
+    return mask
+
+def add_no_outliers_columns(df, columns=AGE_COLUMNS, by='Date', method='mad', threshold=None, min_count=3):
+    """
+    Return a copy of df with a '{column}_no_outliers' column per age column,
+    blanking values that disagree with the other report vintages for the same
+    `by` value (see outlier_mask). by=None treats each whole column as one
+    group; method='std' with by=None is the notebook's remove_outliers_2std.
+    """
+    names = [c for c in columns if c in df.columns]
+    typed = to_typed_frame(df[names])
+    if by is None:
+        codes, n_groups = np.zeros(len(df), dtype=np.int64), 1
+    else:
+        codes, uniques = pd.factorize(df[by])
+        n_groups = len(uniques)
+    mask = outlier_mask(typed.to_numpy(dtype=np.float64), codes, n_groups, method, threshold, min_count)
+
+    result = df.copy()
+    for i, name in enumerate(names):
+        result[f'{name}_no_outliers'] = np.where(mask[:, i], np.nan, typed[name].to_numpy())
+    return result
+
+def stats_columns(df, columns=AGE_COLUMNS, include_no_outliers=True):
+    """Value columns to summarise, in stats-table order: each age, then its _no_outliers variant"""
+    names = []
+    for column in columns:
+        if column not in df.columns:
+            continue
+        names.append(column)
+        if include_no_outliers:
+            names.append(f'{column}_no_outliers')
+    return names
+
+def compute_stats(df, period='Quarter', columns=AGE_COLUMNS, include_no_outliers=None):
+    """
+    Build the stats table for one period ('Quarter' or 'Month') from the
+    combined dataset: one row per period, '{column}_{stat}' for every stat.
+
+    *_no_outliers columns are taken from df when present, otherwise derived
+    with remove_outliers_2std.
+    """
+    freq, _, default_no_outliers = PERIODS[period]
+    if include_no_outliers is None:
+        include_no_outliers = default_no_outliers
+
+    typed = to_typed_frame(df[['Date'] + [c for c in df.columns if c in columns or c.endswith('_no_outliers')]])
+    names = stats_columns(typed, columns, include_no_outliers)
+    for name in names:
+        if name not in typed.columns:
+            typed[name] = remove_outliers_2std(typed[name[:-len('_no_outliers')]])
+
+    codes, periods = pd.factorize(typed['Date'].dt.to_period(freq), sort=True)
+    stats = grouped_stats(typed[names].to_numpy(dtype=np.float64), codes, len(periods))
+
+    table = pd.DataFrame(stats.reshape(len(periods), -1),
+                         columns=[f'{name}_{stat}' for name in names for stat in STAT_NAMES])
+    table.insert(0, period, periods.astype(str))
+    return table
+
+def source_months(combined_df):
+    """Map each Source_File to the sorted 'YYYY-MM' months it has rows for"""
+    months = pd.to_datetime(combined_df['Date'], errors='coerce').dt.to_period('M')
+    frame = pd.DataFrame({'Source_File': combined_df['Source_File'].astype(str), 'Month': months}).dropna()
+    frame = frame.drop_duplicates().sort_values(['Source_File', 'Month'])
+    return {source: [str(m) for m in group] for source, group in frame.groupby('Source_File', sort=False)['Month']}
+
+def source_hashes(combined_df):
+    """
+    Map each Source_File to a SHA-256 digest of its rows in combined_df, so a
+    value revised in place changes the digest even when its months do not
+    """
+    row_hashes = pd.util.hash_pandas_object(combined_df, index=False).to_numpy()
+    sources = combined_df['Source_File'].astype(str).to_numpy()
+    hashes = {}
+    for source, positions in pd.Series(np.arange(len(sources))).groupby(sources, sort=True):
+        hashes[source] = hashlib.sha256(row_hashes[positions.to_numpy()].tobytes()).hexdigest()
+    return hashes
+
+def build_stats_manifest(combined_df, outliers=None):
+    """
+    Stats manifest entry per source file: a hash of its rows in combined_df
+    and the months it contributes to. outliers records the outlier settings,
+    so changing them touches every month
+    """
+    hashes = source_hashes(combined_df)
+    manifest = {}
+    for source, months in source_months(combined_df).items():
+        manifest[source] = {'hash': hashes.get(source), 'months': months}
+        if outliers is not None:
+            manifest[source]['outliers'] = outliers
+    return manifest
+
+def touched_months(old_manifest, new_manifest):
+    """Months whose groups change: every month of a source that was added, changed or removed"""
+    months = set()
+    for source in set(old_manifest) | set(new_manifest):
+        old, new = old_manifest.get(source), new_manifest.get(source)
+        if old != new:
+            months.update((old or {}).get('months', []))
+            months.update((new or {}).get('months', []))
+    return months
+
+def update_period_table(existing, combined_df, period, months):
+    """
+    Recompute only the period groups containing the given months and merge
+    them into the existing stats table. Returns None if the result would not
+    match a full recompute (different columns, or no_outliers derived globally)
+    """
+    freq, _, include_no_outliers = PERIODS[period]
+    if include_no_outliers and not all(f'{c}_no_outliers' in combined_df.columns
+                                       for c in AGE_COLUMNS if c in combined_df.columns):
+        return None
+
+    keys = set(pd.PeriodIndex(sorted(months), freq='M').asfreq(freq).astype(str))
+    periods = pd.to_datetime(combined_df['Date'], errors='coerce').dt.to_period(freq).astype(str)
+    fresh = compute_stats(combined_df[periods.isin(keys)], period)
+    if list(fresh.columns) != list(existing.columns):
+        return None
+
+    kept = existing[~existing[period].astype(str).isin(keys)]
+    merged = pd.concat([kept, fresh], ignore_index=True)
+    return merged.sort_values(period, kind='mergesort').reset_index(drop=True)
+
+def update_stats_tables(combined_df=None, output_format='csv', incremental=False,
+                        outlier_method=None, outlier_threshold=None):
+    """
+    Recompute combined_stats_quarterly and combined_stats_monthly from the combined dataset.
+
+    With incremental=True only the quarters/months touched by source files
+    that were added, changed or removed since the last run (per
+    stats_manifest.json) are recomputed and merged into the existing tables;
+    it falls back to a full recompute when there is no previous run to build on.
+
+    outlier_method ('mad', 'iqr' or 'std') rebuilds the *_no_outliers columns
+    per Date with add_no_outliers_columns before computing the stats; by
+    default the columns already in the combined data are used.
+    """
+    if combined_df is None:
+        combined_df = load_combined_data('csv')
+    outliers = None
+    if outlier_method is not None:
+        combined_df = add_no_outliers_columns(combined_df, method=outlier_method, threshold=outlier_threshold)
+        outliers = f"{outlier_method}:{outlier_threshold or OUTLIER_THRESHOLDS[outlier_method]}"
+    formats = [output_format] if isinstance(output_format, str) else list(output_format)
+    manifest_path = os.path.join(COMBINED_DIR, "stats_manifest.json")
+    manifest = build_stats_manifest(combined_df, outliers)
+    old_manifest = load_manifest(manifest_path) if incremental else {}
+    months = touched_months(old_manifest, manifest)
+
+    if incremental and old_manifest:
+        print(f"Incremental mode: {len(months)} months touched")
+
+    tables = {}
+    for period, (_, name, _) in PERIODS.items():
+        table = None
+        existing_path = find_table(COMBINED_DIR, name, sorted(formats, key=list(OUTPUT_EXTENSIONS).index))
+        if incremental and old_manifest and existing_path is not None:
+            if not months:
+                print(f"{name} is up to date")
+                tables[period] = load_table(existing_path)
+                continue
+            table = update_period_table(load_table(existing_path), combined_df, period, months)
+            if table is None:
+                print(f"{name}: cannot update incrementally, doing a full recompute")
+        if table is None:
+            table = compute_stats(combined_df, period)
+        tables[period] = table
+        for path in write_table(table, COMBINED_DIR, name, formats):
+            print(f"Saved {path}")
+
+    save_manifest(manifest, manifest_path)
+    return tables
+
+if __name__ == "__main__":
+    update_stats_tables(incremental=True)
@@ -0,0 +1,149 @@
+import os
+import sqlite3
+import numpy as np
+import pandas as pd
+
+from processing_data import to_typed_frame, load_combined_data
+from price_stats import AGE_COLUMNS, COMBINED_DIR
+from vintages import report_vintage
+
+DB_PATH = os.path.join(COMBINED_DIR, "prices.sqlite")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS prices (
+    date TEXT NOT NULL,          -- 'YYYY-MM-DD', first of the month
+    age TEXT NOT NULL,           -- '2YO' ... '5YO'
+    value REAL NOT NULL,
+    source_file TEXT NOT NULL,   -- digitized CSV the value came from
+    report_date TEXT,            -- 'YYYY-MM-01' of that report, NULL if the name has no date
+    row_number INTEGER NOT NULL  -- row position within the source file
+);
+CREATE INDEX IF NOT EXISTS idx_prices_age_date ON prices (age, date);
+CREATE INDEX IF NOT EXISTS idx_prices_date ON prices (date);
+CREATE INDEX IF NOT EXISTS idx_prices_source ON prices (source_file);
+CREATE INDEX IF NOT EXISTS idx_prices_report ON prices (report_date);
+"""
+
+def connect(db_path=DB_PATH):
+    """Open the price database, creating the schema if needed"""
+    conn = sqlite3.connect(db_path)
+    conn.executescript(SCHEMA)
+    return conn
+
+def to_long_rows(combined_df, columns=AGE_COLUMNS):
+    """Melt the combined table into (date, age, value, source_file, report_date, row_number) rows"""
+    columns = [c for c in columns if c in combined_df.columns]
+    typed = to_typed_frame(combined_df[['Date', 'Source_File'] + columns])
+    typed['Source_File'] = typed['Source_File'].astype(str)
+    typed['row_number'] = typed.groupby('Source_File').cumcount()
+
+    vintages = {source: report_vintage(source) for source in typed['Source_File'].unique()}
+    report_dates = {source: (f"{v // 12:04d}-{v % 12 + 1:02d}-01" if v >= 0 else None)
+                    for source, v in vintages.items()}
+
+    long_df = typed.melt(id_vars=['Date', 'Source_File', 'row_number'], value_vars=columns,
+                         var_name='age', value_name='value')
+    long_df = long_df.dropna(subset=['Date', 'value'])
+    return pd.DataFrame({
+        'date': long_df['Date'].dt.strftime('%Y-%m-%d'),
+        'age': long_df['age'],
+        'value': long_df['value'].astype(np.float64),
+        'source_file': long_df['Source_File'],
+        'report_date': long_df['Source_File'].map(report_dates),
+        'row_number': long_df['row_number'].astype(np.int64),
+    })
+
+def load_combined(combined_df=None, db_path=DB_PATH, columns=AGE_COLUMNS, partial=False):
+    """
+    Load the combined dataset into the database, all in one transaction.
+
+    combined_df is taken to be the full combined table, so the database is
+    replaced with it and source files that were deleted or renamed since the
+    last load drop out, as they do from combined_data. With partial=True
+    only the rows of the source files in combined_df are replaced and every
+    other source is kept. Returns the number of rows inserted.
+    """
+    if combined_df is None:
+        combined_df = load_combined_data('csv')
+    rows = to_long_rows(combined_df, columns)
+    sources = [(str(source),) for source in combined_df['Source_File'].unique()]
+
+    conn = connect(db_path)
+    try:
+        with conn:
+            if partial:
+                conn.executemany("DELETE FROM prices WHERE source_file = ?", sources)
+            else:
+                loaded = {source for source, in conn.execute("SELECT DISTINCT source_file FROM prices")}
+                removed = loaded - {source for source, in sources}
+                if removed:
+                    print(f"Dropping {len(removed)} source files no longer in the combined data")
+                conn.execute("DELETE FROM prices")
+            conn.executemany(
+                "INSERT INTO prices (date, age, value, source_file, report_date, row_number) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                rows.itertuples(index=False, name=None))
+        conn.execute("ANALYZE")
+    finally:
+        conn.close()
+    print(f"Loaded {len(rows)} values from {len(sources)} source files into {db_path}")
+    return len(rows)
+
+def remove_sources(source_files, db_path=DB_PATH):
+    """Delete every row of the given source files"""
+    conn = connect(db_path)
+    try:
+        with conn:
+            conn.executemany("DELETE FROM prices WHERE source_file = ?", [(s,) for s in source_files])
+    finally:
+        conn.close()
+
+def _as_date(value):
+    # Accept '2020', '2020-06', '2020-06-01' or anything pandas can parse
+    if isinstance(value, str) and len(value) == 4 and value.isdigit():
+        value = f"{value}-01-01"
+    return pd.Timestamp(value).strftime('%Y-%m-%d')
+
+def query_prices(age=None, start=None, end=None, reports_after=None, reports_before=None, source_file=None,
+                 db_path=DB_PATH):
+    """
+    Query price values as a DataFrame. Every filter is optional and uses an index:
+
+    - age: one age class or a list of them
+    - start / end: Date range, inclusive start and exclusive end
+    - reports_after / reports_before: report date range, exclusive on both ends
+    - source_file: one source file or a list of them
+
+    e.g. all 4YO prices for 2020 from reports after 2021:
+        query_prices('4YO', start='2020', end='2021', reports_after='2021-12')
+    """
+    clauses, params = [], []
+    for column, value in (('age', age), ('source_file', source_file)):
+        if value is None:
+            continue
+        values = [value] if isinstance(value, str) else list(value)
+        clauses.append(f"{column} IN ({', '.join('?' * len(values))})")
+        params.extend(values)
+    for column, op, value in (('date', '>=', start), ('date', '<', end),
+                              ('report_date', '>', reports_after), ('report_date', '<', reports_before)):
+        if value is not None:
+            clauses.append(f"{column} {op} ?")
+            params.append(_as_date(value))
+
+    sql = "SELECT date, age, value, source_file, report_date FROM prices"
+    if clauses:
+        sql += " WHERE " + " AND ".join(clauses)
+    sql += " ORDER BY date, age, report_date, source_file, row_number"
+
+    conn = connect(db_path)
+    try:
+        df = pd.read_sql_query(sql, conn, params=params)
+    finally:
+        conn.close()
+    df['date'] = pd.to_datetime(df['date'])
+    df['report_date'] = pd.to_datetime(df['report_date'])
+    return df
+
+if __name__ == "__main__":
+    load_combined()
+    print(query_prices('4YO', start='2020', end='2021', reports_after='2021-12'))
@@ -2,14 +2,217 @@ import pandas as pd
 import os
 import glob
 import re
+import json
 from datetime import datetime
+from functools import lru_cache
+from concurrent.futures import ProcessPoolExecutor
 
-def combine_csv_files():
+from content_hash import file_content_hash
+
+try:
+    import pyarrow  # Optional: only needed for Parquet/Feather output
+except ImportError:
+    pyarrow = None
+
+# File extension for each supported output format
+OUTPUT_EXTENSIONS = {'csv': '.csv', 'parquet': '.parquet', 'feather': '.feather'}
+
+# Columns that hold labels rather than prices
+KEY_COLUMNS = ('Date', 'Source_File', 'Quarter', 'Month')
+
+# Sleeper price columns like "5YO Slpr.", standardized to "5YO"
+SLEEPER_COLUMN_PATTERN = re.compile(r'(\d+YO)\s+Slpr\.?')
+
+def process_csv_file(csv_file):
+    """
+    Read a single digitized CSV and return it with parsed dates and its source file name
+    """
+    filename = os.path.basename(csv_file)
+    print(f"Reading {filename}")
+    
+    # Read CSV file
+    df = pd.read_csv(csv_file)
+    
+    # Rename the first column to "Date" regardless of its original name
+    first_col_name = df.columns[0]
+    df = df.rename(columns={first_col_name: "Date"})
+    
+    # Process dates with special handling for this format
+    print(f"Processing dates in {filename}")
+    df = process_dates(df)
+    
+    # Add source file information
+    df['Source_File'] = filename
+    
+    # Ensure "Date" is the first column
+    cols = df.columns.tolist()
+    cols.remove("Date")
+    df = df[["Date"] + cols]
+    
+    return df
+
+def load_manifest(manifest_path):
+    """
+    Load the combine manifest ({filename: {hash, size, mtime_ns, rows}}), or an empty one
+    """
+    if not os.path.isfile(manifest_path):
+        return {}
+    with open(manifest_path, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+def save_manifest(manifest, manifest_path):
+    """
+    Write the combine manifest atomically so an interrupted run never leaves it half-written
+    """
+    tmp_path = manifest_path + ".tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+    os.replace(tmp_path, manifest_path)
+
+def build_manifest_entry(csv_file, previous=None):
+    """
+    Describe a CSV file for the manifest, reusing the previous hash when size and mtime are unchanged
+    """
+    stat = os.stat(csv_file)
+    if previous and previous.get('size') == stat.st_size and previous.get('mtime_ns') == stat.st_mtime_ns:
+        content_hash = previous['hash']
+    else:
+        content_hash = file_content_hash(csv_file)
+    return {'hash': content_hash, 'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns}
+
+def to_typed_frame(df):
+    """
+    Return a copy of df with a datetime Date, float price columns and a categorical Source_File
+    """
+    typed = df.copy()
+    if 'Date' in typed.columns:
+        typed['Date'] = pd.to_datetime(typed['Date'], errors='coerce')
+    for col in typed.columns:
+        if col in KEY_COLUMNS:
+            continue
+        if pd.api.types.is_numeric_dtype(typed[col]):
+            typed[col] = typed[col].astype('float64')
+        else:
+            # Some digitized files use thousands separators, e.g. "78,000"
+            cleaned = typed[col].astype(str).str.replace(',', '', regex=False)
+            typed[col] = pd.to_numeric(cleaned, errors='coerce').astype('float64')
+    if 'Source_File' in typed.columns:
+        typed['Source_File'] = typed['Source_File'].astype('category')
+    # Feather only stores a default RangeIndex
+    return typed.reset_index(drop=True)
+
+def write_table(df, output_dir, name, output_format='csv'):
+    """
+    Write df as name.csv / name.parquet / name.feather in output_dir.
+
+    output_format is one format or a list of formats. The columnar formats
+    store typed columns (see to_typed_frame) and need pyarrow.
+    Returns the list of written paths.
+    """
+    formats = [output_format] if isinstance(output_format, str) else list(output_format)
+    unknown = [fmt for fmt in formats if fmt not in OUTPUT_EXTENSIONS]
+    if unknown:
+        raise ValueError(f"Unsupported output format(s): {unknown}. Choose from {list(OUTPUT_EXTENSIONS)}")
+    if pyarrow is None and any(fmt != 'csv' for fmt in formats):
+        raise ImportError("pyarrow is required for Parquet/Feather output (pip install pyarrow)")
+    
+    os.makedirs(output_dir, exist_ok=True)
+    typed = None
+    written = []
+    for fmt in formats:
+        path = os.path.join(output_dir, name + OUTPUT_EXTENSIONS[fmt])
+        if fmt == 'csv':
+            df.to_csv(path, index=False)
+        else:
+            if typed is None:
+                typed = to_typed_frame(df)
+            if fmt == 'parquet':
+                typed.to_parquet(path, index=False)
+            else:
+                typed.to_feather(path)
+        written.append(path)
+    return written
+
+def load_table(path):
+    """
+    Load a table written by write_table, picking the reader from the file extension
+
+    CSVs are parsed with round-trip float precision: update_stats_tables'
+    incremental mode keeps rows read back from the existing stats tables and
+    relies on them matching a full recompute bit for bit.
+    """
+    ext = os.path.splitext(path)[1].lower()
+    if ext == '.parquet':
+        return pd.read_parquet(path)
+    if ext == '.feather':
+        return pd.read_feather(path)
+    # round_trip so floats read back exactly as written (the default parser can be off by an ulp)
+    df = pd.read_csv(path, float_precision='round_trip')
+    if 'Date' in df.columns:
+        df['Date'] = pd.to_datetime(df['Date'])
+    return df
+
+def find_table(output_dir, name, formats=('csv', 'parquet', 'feather')):
+    """
+    Return the path of the first existing name.<ext> in output_dir, trying formats in order
+    """
+    for fmt in formats:
+        path = os.path.join(output_dir, name + OUTPUT_EXTENSIONS[fmt])
+        if os.path.isfile(path):
+            return path
+    return None
+
+def load_combined_data(output_format='parquet'):
+    """
+    Load the combined dataset, preferring output_format and falling back to the other formats
+    """
+    output_dir = r"C:\Users\clint\Desktop\Lifecycle_RA\Data\Processed\Combined_Csvs"
+    formats = [output_format] + [fmt for fmt in OUTPUT_EXTENSIONS if fmt != output_format]
+    path = find_table(output_dir, "combined_data", formats)
+    if path is None:
+        raise FileNotFoundError(f"No combined_data file found in {output_dir}")
+    return load_table(path)
+
+def convert_stats_tables(output_format='parquet'):
+    """
+    Write columnar copies of the quarterly and monthly stats CSVs
+    """
+    output_dir = r"C:\Users\clint\Desktop\Lifecycle_RA\Data\Processed\Combined_Csvs"
+    for name in ("combined_stats_quarterly", "combined_stats_monthly"):
+        csv_path = os.path.join(output_dir, name + ".csv")
+        if not os.path.isfile(csv_path):
+            print(f"Skipping {name}: {csv_path} not found")
+            continue
+        for path in write_table(pd.read_csv(csv_path), output_dir, name, output_format):
+            print(f"Saved {path}")
+
+def combine_csv_files(workers=1, incremental=False, output_format='csv'):
+    """
+    Combine all digitized CSVs into a single dataset sorted by Date.
+
+    With workers > 1 the files are read and processed in a pool of worker
+    processes; results are collected in file order so the output is identical
+    to the serial path.
+
+    With incremental=True only CSVs that are new or whose content hash changed
+    since the last run (per combined_manifest.json) are processed. Rows from
+    changed or deleted files are dropped from the existing combined_data.csv
+    and the fresh rows are merged in.
+
+    output_format is 'csv', 'parquet', 'feather' or a list of them; see write_table.
+    """
     # Define the directory path containing the CSV files
     csv_dir = r"C:\Users\clint\Desktop\Lifecycle_RA\Data\cropped_sorted_csvs"
+    output_dir = r"C:\Users\clint\Desktop\Lifecycle_RA\Data\Processed\Combined_Csvs"
+    formats = [output_format] if isinstance(output_format, str) else list(output_format)
+    # Written in this order, so the base below is never newer than the other outputs of a run
+    formats = sorted(formats, key=list(OUTPUT_EXTENSIONS).index)
+    # Prefer the CSV as the incremental base so untouched rows are written back verbatim
+    existing_path = find_table(output_dir, "combined_data", formats)
+    manifest_path = os.path.join(output_dir, "combined_manifest.json")
     
-    # Use glob to get all CSV files in the directory
-    csv_files = glob.glob(os.path.join(csv_dir, "*.csv"))
+    # Use glob to get all CSV files in the directory, sorted so runs are reproducible
+    csv_files = sorted(glob.glob(os.path.join(csv_dir, "*.csv")))
     
     if not csv_files:
         print(f"No CSV files found in {csv_dir}")
@@ -17,152 +220,185 @@ def combine_csv_files():
     
     print(f"Found {len(csv_files)} CSV files")
     
-    # Create a list to store processed DataFrames
-    processed_dfs = []
-    
-    # Read and process each CSV file
+    # Fingerprint every input file against the previous manifest
+    old_manifest = load_manifest(manifest_path) if incremental else {}
+    manifest = {}
     for csv_file in csv_files:
         filename = os.path.basename(csv_file)
-        print(f"Reading {filename}")
-        
-        # Read CSV file
-        df = pd.read_csv(csv_file)
-        
-        # Rename the first column to "Date" regardless of its original name
-        first_col_name = df.columns[0]
-        df = df.rename(columns={first_col_name: "Date"})
+        manifest[filename] = build_manifest_entry(csv_file, old_manifest.get(filename))
+    
+    existing_df = None
+    files_to_process = csv_files
+    if incremental and old_manifest and existing_path is not None:
+        files_to_process = [f for f in csv_files
+                            if old_manifest.get(os.path.basename(f), {}).get('hash') != manifest[os.path.basename(f)]['hash']]
+        stale_sources = set(old_manifest) - set(manifest)
+        stale_sources.update(os.path.basename(f) for f in files_to_process)
         
-        # Process dates with special handling for this format
-        print(f"Processing dates in {filename}")
-        df = process_dates(df)
+        print(f"Incremental mode: {len(files_to_process)} new or changed, "
+              f"{len(set(old_manifest) - set(manifest))} deleted, "
+              f"{len(csv_files) - len(files_to_process)} unchanged")
         
-        # Add source file information
-        df['Source_File'] = filename
+        if not stale_sources:
+            # A requested format that is missing or older than the base was not written by the last run
+            base_mtime = os.stat(existing_path).st_mtime_ns
+            outdated = [fmt for fmt in formats
+                        if not os.path.isfile(os.path.join(output_dir, "combined_data" + OUTPUT_EXTENSIONS[fmt]))
+                        or os.stat(os.path.join(output_dir, "combined_data" + OUTPUT_EXTENSIONS[fmt])).st_mtime_ns < base_mtime]
+            existing_df = load_table(existing_path)
+            if not outdated:
+                print("Combined data is up to date")
+                return existing_df
+            output_paths = write_table(existing_df, output_dir, "combined_data", outdated)
+            print(f"Inputs unchanged, wrote missing or outdated output(s): {', '.join(output_paths)}")
+            return existing_df
         
-        # Ensure "Date" is the first column
-        cols = df.columns.tolist()
-        cols.remove("Date")
-        df = df[["Date"] + cols]
+        existing_df = load_table(existing_path)
+        existing_df = existing_df[~existing_df['Source_File'].isin(stale_sources)]
         
-        processed_dfs.append(df)
+        # Carry row counts over for files that were not re-processed
+        for filename, entry in manifest.items():
+            if filename in old_manifest and 'rows' in old_manifest[filename]:
+                entry['rows'] = old_manifest[filename]['rows']
+    elif incremental:
+        print("Incremental mode: no previous manifest or combined data, doing a full rebuild")
+    
+    # Read and process each CSV file
+    if workers > 1 and len(files_to_process) > 1:
+        print(f"Processing files with {workers} worker processes")
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            # map() yields results in submission order, keeping the output deterministic
+            processed_dfs = list(executor.map(process_csv_file, files_to_process,
+                                              chunksize=max(1, len(files_to_process) // (workers * 4))))
+    else:
+        processed_dfs = [process_csv_file(csv_file) for csv_file in files_to_process]
+    
+    for csv_file, df in zip(files_to_process, processed_dfs):
+        manifest[os.path.basename(csv_file)]['rows'] = len(df)
+    
+    if existing_df is not None:
+        processed_dfs = [existing_df] + processed_dfs
     
     # Combine all DataFrames with vertical concatenation
     print("Combining files with vertical concatenation based on Date column")
     combined_df = pd.concat(processed_dfs, ignore_index=True)
     
-    # Sort the combined DataFrame by Date for better organization
-    combined_df = combined_df.sort_values('Date')
+    # Sort the combined DataFrame by Date for better organization. Ties are ordered
+    # by source file and then by row position within the file, which is the same
+    # order a full rebuild produces, so incremental and full runs agree
+    combined_df = combined_df.sort_values(['Date', 'Source_File'], kind='mergesort')
     
-    # Save the combined DataFrame
-    output_dir = r"C:\Users\clint\Desktop\Lifecycle_RA\Data\Processed\Combined_Csvs"
-    # Create the output directory if it doesn't exist
-    os.makedirs(output_dir, exist_ok=True)
+    # Save the combined DataFrame in every requested format
+    output_paths = write_table(combined_df, output_dir, "combined_data", formats)
+    save_manifest(manifest, manifest_path)
     
-    output_path = os.path.join(output_dir, "combined_data.csv")
-    combined_df.to_csv(output_path, index=False)
-    
-    print(f"Combined data saved to {output_path}")
+    print(f"Combined data saved to {', '.join(output_paths)}")
     print(f"Combined data shape: {combined_df.shape}")
     print(f"Date range: {combined_df['Date'].min()} to {combined_df['Date'].max()}")
     
     return combined_df
 
-def standardize_column_names(df):
+@lru_cache(maxsize=None)
+def column_plan(columns):
     """
-    Standardize column names by converting patterns like "5YO Slpr." to "5YO"
-    Handle potential duplicate columns after standardization
+    Rename/merge plan for one header signature (tuple of column names),
+    computed once per distinct header and memoized. Returns
+    (renames, merges, keep, standardized, duplicates): renames as (old, new)
+    pairs, merges as (base column, columns coalesced into it) pairs, keep as
+    the mask of columns left after renaming (first of any duplicate names),
+    standardized as every (column, base name) match and duplicates as the
+    names that occurred more than once. Prints nothing, so callers log per file.
     """
     rename_dict = {}
-    for col in df.columns:
+    for col in columns:
         # Look for pattern like "5YO Slpr.", "6YO Slpr.", etc.
-        match = re.match(r'(\d+YO)\s+Slpr\.?', col)
+        match = SLEEPER_COLUMN_PATTERN.match(col)
         if match:
-            base_name = match.group(1)  # Extract the base name (e.g., "5YO")
-            rename_dict[col] = base_name
-            print(f"  Standardizing column: {col} -> {base_name}")
-    
-    # Apply the renaming
-    if rename_dict:
-        # Check for duplicate columns after renaming
-        new_columns = [rename_dict.get(col, col) for col in df.columns]
-        duplicates = [col for col in set(new_columns) if new_columns.count(col) > 1]
-        
-        if duplicates:
-            print(f"  Warning: Found duplicate columns after standardization: {duplicates}")
-            # For each duplicate column, merge their values
-            for dup_col in duplicates:
-                # Find all original columns that would map to this duplicate
-                orig_cols = [col for col in df.columns if rename_dict.get(col, col) == dup_col]
-                # Keep the first column as is, and merge others into it
-                if len(orig_cols) > 1:
-                    base_col = orig_cols[0]
-                    for merge_col in orig_cols[1:]:
-                        # Fill NaN values in the base column with values from the merge column
-                        mask = df[base_col].isna()
-                        df.loc[mask, base_col] = df.loc[mask, merge_col]
-                        # Remove the merge column from the rename dictionary so it gets dropped
-                        if merge_col in rename_dict:
-                            del rename_dict[merge_col]
-        
-        # Rename columns
-        df = df.rename(columns=rename_dict)
-        
-        # Remove any columns that would create duplicates
-        df = df.loc[:, ~df.columns.duplicated()]
-    
-    return df
+            rename_dict[col] = match.group(1)  # Extract the base name (e.g., "5YO")
+    if not rename_dict:
+        return (), (), (), (), ()
+    standardized = tuple(rename_dict.items())
+
+    # Original columns per standardized name, in column order
+    groups = {}
+    for col in columns:
+        groups.setdefault(rename_dict.get(col, col), []).append(col)
+
+    merges = []
+    duplicates = [name for name, cols in groups.items() if len(cols) > 1]
+    for name in duplicates:
+        # Keep the first column and fill its gaps from the others, which keep their original names
+        base_col, *merge_cols = groups[name]
+        merges.append((base_col, tuple(merge_cols)))
+        for merge_col in merge_cols:
+            rename_dict.pop(merge_col, None)
+
+    new_columns = pd.Index([rename_dict.get(col, col) for col in columns])
+    return tuple(rename_dict.items()), tuple(merges), tuple(~new_columns.duplicated()), standardized, tuple(duplicates)
+
+def standardize_column_names(df):
+    """
+    Standardize column names by converting patterns like "5YO Slpr." to "5YO"
+    Handle potential duplicate columns after standardization
+
+    Files from the same report format share one plan (see column_plan), so
+    only the first file of each header layout pays for the regex work.
+    """
+    renames, merges, keep, standardized, duplicates = column_plan(tuple(df.columns))
+    if not renames and not merges:
+        return df
+
+    # Logged here rather than in column_plan, which only runs once per header
+    for col, base_name in standardized:
+        print(f"  Standardizing column: {col} -> {base_name}")
+    if duplicates:
+        print(f"  Warning: Found duplicate columns after standardization: {list(duplicates)}")
+
+    for base_col, merge_cols in merges:
+        # Coalesce: first non-null value across the base and merge columns
+        df[base_col] = df[[base_col, *merge_cols]].bfill(axis=1).iloc[:, 0]
+
+    df = df.rename(columns=dict(renames))
+    return df.loc[:, list(keep)]
 
 def process_dates(df):
     """
     Process date column with special handling for formats like 'Jan-16' and 'Feb' (without year)
+
+    Works on the whole column at once: annotations are stripped with string
+    operations and the year of month-only rows is inferred with cumulative sums
+    instead of carrying the current year forward row by row.
     """
-    current_year = None
-    processed_dates = []
-    
-    for date_str in df['Date']:
-        # Convert to string to ensure consistent handling
-        date_str = str(date_str).strip()
-        
-        # Handle special case like "Dec (est.)"
-        if '(' in date_str:
-            # Remove any parenthetical annotations
-            date_str = date_str.split('(')[0].strip()
-        
-        # Handle cases like 'Jan-16'
-        if '-' in date_str:
-            parts = date_str.split('-')
-            month = parts[0]
-            year_suffix = parts[1]
-            
-            # Clean the year suffix to handle any non-numeric characters
-            year_suffix = ''.join(c for c in year_suffix if c.isdigit())
-            
-            # Convert year suffix to full year (e.g., '16' -> '2016')
-            if len(year_suffix) == 2:
-                full_year = int("20" + year_suffix)
-            else:
-                full_year = int(year_suffix)
-            
-            current_year = full_year
-            formatted_date = f"{month} {full_year}"
-            
-        # Handle cases like 'Feb' (month only, need to infer year)
-        else:
-            month = date_str
-            if current_year is None:
-                # If we haven't seen a year yet, default to 2016 (based on your example)
-                current_year = 2016
-            
-            formatted_date = f"{month} {current_year}"
-            
-            # If month is December, increment year for next entry
-            if month.lower() == 'dec':
-                current_year += 1
-        
-        processed_dates.append(formatted_date)
-    
+    # Convert to string to ensure consistent handling (missing values become 'None'/'nan'
+    # like str() does, rather than staying NaN as astype(str) leaves them)
+    date_strs = df['Date'].astype(object).map(str).str.strip()
+
+    # Handle special case like "Dec (est.)" by removing any parenthetical annotations
+    date_strs = date_strs.str.split('(', n=1).str[0].str.strip()
+
+    # Rows like 'Jan-16' carry their own year, rows like 'Feb' need it inferred
+    has_year = date_strs.str.contains('-', regex=False).fillna(False).astype(bool)
+    parts = date_strs.str.split('-')
+    months = parts.str[0].where(has_year, date_strs)
+
+    # Convert year suffix to full year (e.g., '16' -> '2016'); month-only columns have none
+    explicit_years = pd.Series(pd.NA, index=df.index, dtype="Int64")
+    if has_year.any():
+        # Clean the year suffix to handle any non-numeric characters
+        suffix = parts.str[1][has_year].astype(str).str.replace(r'\D', '', regex=True)
+        years = suffix.astype(int)
+        explicit_years[has_year] = years.where(suffix.str.len() != 2, 2000 + years)
+
+    # Each explicit year starts a new block; month-only rows take the block's year
+    # (2016 before any explicit year) plus the number of earlier 'Dec' rows in the block
+    block = has_year.cumsum()
+    is_dec = (~has_year) & (months.str.lower() == 'dec').fillna(False).astype(bool)
+    decs_before = is_dec.astype(int).groupby(block).cumsum() - is_dec.astype(int)
+    block_year = explicit_years.ffill().fillna(2016)
+    inferred_years = explicit_years.where(has_year, block_year + decs_before).astype(int)
+
     # Replace the Date column with processed dates
-    df['Date'] = processed_dates
+    df['Date'] = months.astype(str) + ' ' + inferred_years.astype(str)
     
     # Convert to datetime objects
     df['Date'] = pd.to_datetime(df['Date'], format='%b %Y', errors='coerce')
@@ -0,0 +1,122 @@
+import os
+import sqlite3
+import threading
+from datetime import datetime
+
+# Per-image states, in the order a successful digitization passes through them;
+# 'renamed' (the CSV is in its final place) means done
+JOURNAL_STATES = ('pending', 'uploaded', 'downloaded', 'renamed', 'failed')
+
+JOURNAL_SCHEMA = """
+CREATE TABLE IF NOT EXISTS images (
+    image_path TEXT PRIMARY KEY,
+    state TEXT NOT NULL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    reason TEXT,
+    output_csv TEXT,
+    run_id INTEGER,
+    updated TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_images_state ON images (state);
+CREATE TABLE IF NOT EXISTS runs (
+    run_id INTEGER PRIMARY KEY AUTOINCREMENT,
+    started TEXT NOT NULL,
+    finished TEXT,
+    images INTEGER,
+    succeeded INTEGER,
+    failed INTEGER
+);
+"""
+
+def _now():
+    return datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+
+class RunJournal:
+    """
+    Persistent per-image record of a digitization batch, so an interrupted
+    run can be resumed without redoing finished images.
+
+    Every state change is committed immediately (SQLite in WAL mode), so the
+    journal is current up to the last completed step even if the process
+    dies. Safe to share between worker threads.
+    """
+    def __init__(self, db_path):
+        self.db_path = db_path
+        directory = os.path.dirname(db_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(db_path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.executescript(JOURNAL_SCHEMA)
+        self.run_id = None
+
+    def start_run(self, image_paths):
+        """Open a new run and mark every image not already done as pending"""
+        with self._lock, self._conn:
+            cursor = self._conn.execute("INSERT INTO runs (started, images) VALUES (?, ?)",
+                                        (_now(), len(image_paths)))
+            self.run_id = cursor.lastrowid
+            self._conn.executemany(
+                "INSERT INTO images (image_path, state, run_id, updated) VALUES (?, 'pending', ?, ?) "
+                "ON CONFLICT(image_path) DO UPDATE SET state = 'pending', run_id = excluded.run_id, "
+                "updated = excluded.updated WHERE images.state != 'renamed'",
+                [(path, self.run_id, _now()) for path in image_paths])
+        return self.run_id
+
+    def mark(self, image_path, state, reason=None, output_csv=None, attempt=None):
+        """
+        Record image_path reaching state. attempt says whether this ends an
+        attempt to digitize it; by default 'failed' and 'renamed' do, so an
+        image that fails before or during upload is counted too
+        """
+        if state not in JOURNAL_STATES:
+            raise ValueError(f"Unknown journal state '{state}'")
+        if attempt is None:
+            attempt = state in ('failed', 'renamed')
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT INTO images (image_path, state, attempts, reason, output_csv, run_id, updated) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?) "
+                "ON CONFLICT(image_path) DO UPDATE SET state = excluded.state, "
+                "attempts = images.attempts + excluded.attempts, reason = excluded.reason, "
+                "output_csv = COALESCE(excluded.output_csv, images.output_csv), "
+                "run_id = excluded.run_id, updated = excluded.updated",
+                (image_path, state, 1 if attempt else 0, reason, output_csv, self.run_id, _now()))
+
+    def state(self, image_path):
+        """The journal row for image_path as a dict, or None"""
+        with self._lock:
+            cursor = self._conn.execute("SELECT * FROM images WHERE image_path = ?", (image_path,))
+            row = cursor.fetchone()
+            if row is None:
+                return None
+            return dict(zip([column[0] for column in cursor.description], row))
+
+    def completed(self, image_paths):
+        """Subset of image_paths whose CSV was put in place and still exists"""
+        wanted = set(image_paths)
+        with self._lock:
+            rows = self._conn.execute("SELECT image_path, output_csv FROM images WHERE state = 'renamed'").fetchall()
+        return {path for path, output_csv in rows
+                if path in wanted and output_csv and os.path.isfile(output_csv)}
+
+    def finish_run(self, succeeded, failed):
+        with self._lock, self._conn:
+            self._conn.execute("UPDATE runs SET finished = ?, succeeded = ?, failed = ? WHERE run_id = ?",
+                               (_now(), succeeded, failed, self.run_id))
+
+    def summary(self):
+        """{state: count} over every image in the journal"""
+        with self._lock:
+            return dict(self._conn.execute("SELECT state, COUNT(*) FROM images GROUP BY state").fetchall())
+
+    def failures(self):
+        """[(image_path, attempts, reason)] for images whose last attempt failed"""
+        with self._lock:
+            return self._conn.execute("SELECT image_path, attempts, reason FROM images WHERE state = 'failed' "
+                                      "ORDER BY image_path").fetchall()
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
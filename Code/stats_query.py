@@ -0,0 +1,194 @@
+import os
+import sys
+import csv
+import json
+import mmap
+import math
+import struct
+import bisect
+import argparse
+
+# Deliberately standard library only (no pandas/numpy) so lookups from scripts start fast
+
+COMBINED_DIR = r"C:\Users\clint\Desktop\Lifecycle_RA\Data\Processed\Combined_Csvs"
+CACHE_PATH = os.path.join(COMBINED_DIR, "combined_stats.bin")
+
+# Period column -> stats table it is read from
+STATS_TABLES = {'Quarter': "combined_stats_quarterly.csv", 'Month': "combined_stats_monthly.csv"}
+
+MAGIC = b"LRASTAT1"
+
+def build_stats_cache(stats_dir=COMBINED_DIR, cache_path=CACHE_PATH):
+    """
+    Pack the quarterly and monthly stats tables into one file: MAGIC, the
+    header length, a JSON header (periods and columns of each table and where
+    its values start) and then every value as a little-endian float64, row by row
+    """
+    header = {'tables': {}}
+    blocks = []
+    offset = 0
+    for period, file_name in STATS_TABLES.items():
+        path = os.path.join(stats_dir, file_name)
+        if not os.path.isfile(path):
+            continue
+        with open(path, 'r', newline='', encoding='utf-8') as f:
+            reader = csv.reader(f)
+            columns = next(reader)[1:]
+            rows = sorted(reader, key=lambda row: row[0])
+        values = [float(cell) if cell else math.nan for row in rows for cell in row[1:]]
+        header['tables'][period] = {
+            'periods': [row[0] for row in rows],
+            'columns': columns,
+            'offset': offset,
+            'source_mtime_ns': os.stat(path).st_mtime_ns,
+        }
+        blocks.append(struct.pack(f'<{len(values)}d', *values))
+        offset += len(values)
+
+    header_bytes = json.dumps(header).encode('utf-8')
+    # Pad so the values start on an 8-byte boundary
+    header_bytes += b' ' * (-(len(MAGIC) + 8 + len(header_bytes)) % 8)
+    tmp_path = cache_path + ".tmp"
+    with open(tmp_path, 'wb') as f:
+        f.write(MAGIC)
+        f.write(struct.pack('<Q', len(header_bytes)))
+        f.write(header_bytes)
+        for block in blocks:
+            f.write(block)
+    os.replace(tmp_path, cache_path)
+    return cache_path
+
+class StatsCache:
+    """
+    Memory-mapped view of the packed stats tables.
+
+    value('2019Q3', '5YO') -> mean 5YO price in 2019Q3; periods like
+    '2019-07' are looked up in the monthly table. Lookups are two dict
+    lookups and one read from the mapped file.
+    """
+    def __init__(self, cache_path=CACHE_PATH):
+        self._file = open(cache_path, 'rb')
+        self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        if self._map[:len(MAGIC)] != MAGIC:
+            raise ValueError(f"{cache_path} is not a stats cache")
+        header_len = struct.unpack_from('<Q', self._map, len(MAGIC))[0]
+        start = len(MAGIC) + 8
+        self.header = json.loads(self._map[start:start + header_len])
+        self._values = memoryview(self._map)[start + header_len:].cast('d')
+
+        self.tables = {}
+        for period, table in self.header['tables'].items():
+            self.tables[period] = {
+                'periods': table['periods'],
+                'row': {p: i for i, p in enumerate(table['periods'])},
+                'column': {c: i for i, c in enumerate(table['columns'])},
+                'width': len(table['columns']),
+                'offset': table['offset'],
+            }
+
+    def close(self):
+        self._values.release()
+        self._map.close()
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    @staticmethod
+    def period_kind(period):
+        return 'Quarter' if 'Q' in period.upper() else 'Month'
+
+    @staticmethod
+    def column_name(age, stat='mean', no_outliers=False):
+        return f"{age}_no_outliers_{stat}" if no_outliers else f"{age}_{stat}"
+
+    def value(self, period, age, stat='mean', no_outliers=False):
+        """One statistic for one period; NaN if that period has no data"""
+        period = period.upper()
+        table = self.tables[self.period_kind(period)]
+        row = table['row'][period]
+        column = table['column'][self.column_name(age, stat, no_outliers)]
+        return self._values[table['offset'] + row * table['width'] + column]
+
+    def range(self, start, end, age, stat='mean', no_outliers=False):
+        """[(period, value)] for start <= period <= end, both in the same (quarter/month) form"""
+        start, end = start.upper(), end.upper()
+        kind = self.period_kind(start)
+        if self.period_kind(end) != kind:
+            raise ValueError("start and end must both be quarters or both be months")
+        table = self.tables[kind]
+        column = table['column'][self.column_name(age, stat, no_outliers)]
+        periods = table['periods']
+        lo, hi = bisect.bisect_left(periods, start), bisect.bisect_right(periods, end)
+        base = table['offset'] + column
+        return [(periods[i], self._values[base + i * table['width']]) for i in range(lo, hi)]
+
+def cache_is_stale(stats_dir=COMBINED_DIR, cache_path=CACHE_PATH):
+    """True if the cache is missing or a stats table changed since it was built"""
+    if not os.path.isfile(cache_path):
+        return True
+    with open(cache_path, 'rb') as f:
+        if f.read(len(MAGIC)) != MAGIC:
+            return True
+        header_len = struct.unpack('<Q', f.read(8))[0]
+        header = json.loads(f.read(header_len))
+    for period, file_name in STATS_TABLES.items():
+        path = os.path.join(stats_dir, file_name)
+        built = header['tables'].get(period, {}).get('source_mtime_ns')
+        current = os.stat(path).st_mtime_ns if os.path.isfile(path) else None
+        if built != current:
+            return True
+    return False
+
+_cache = None
+
+def get_cache(stats_dir=COMBINED_DIR, cache_path=CACHE_PATH):
+    """Process-wide StatsCache, rebuilt first if the stats tables changed"""
+    global _cache
+    if _cache is None:
+        if cache_is_stale(stats_dir, cache_path):
+            build_stats_cache(stats_dir, cache_path)
+        _cache = StatsCache(cache_path)
+    return _cache
+
+def query(period, age, stat='mean', no_outliers=False):
+    """e.g. query('2019Q3', '5YO') -> average 5YO sleeper price in 2019Q3"""
+    return get_cache().value(period, age, stat, no_outliers)
+
+def query_range(start, end, age, stat='mean', no_outliers=False):
+    return get_cache().range(start, end, age, stat, no_outliers)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Look up sleeper price statistics by quarter or month")
+    parser.add_argument("period", nargs='?', help="e.g. 2019Q3 or 2019-07")
+    parser.add_argument("age", nargs='?', help="2YO, 3YO, 4YO or 5YO")
+    parser.add_argument("--to", dest="end", help="last period of a range query")
+    parser.add_argument("--stat", default="mean",
+                        help="mean, median, min, max, mean_no_extremes or median_no_extremes")
+    parser.add_argument("--no-outliers", action="store_true", help="use the *_no_outliers statistics")
+    parser.add_argument("--build", action="store_true", help="rebuild the cache from the stats CSVs")
+    args = parser.parse_args(argv)
+
+    if args.build:
+        print(f"Built {build_stats_cache()}")
+    if args.period is None or args.age is None:
+        if not args.build:
+            parser.error("period and age are required")
+        return 0
+
+    try:
+        if args.end:
+            for period, value in query_range(args.period, args.end, args.age, args.stat, args.no_outliers):
+                print(f"{period}\t{value:.2f}")
+        else:
+            print(f"{query(args.period, args.age, args.stat, args.no_outliers):.2f}")
+    except KeyError as e:
+        print(f"Unknown period or column: {e}", file=sys.stderr)
+        return 1
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,103 @@
+import os
+import re
+import numpy as np
+import pandas as pd
+
+from processing_data import to_typed_frame, write_table, load_combined_data
+from price_stats import AGE_COLUMNS, COMBINED_DIR, grouped_stats, STAT_NAMES
+
+# How one consolidated value is picked from all vintages of a (Date, age) point
+POLICIES = ('latest', 'earliest', 'median', 'mean')
+
+def report_vintage(source_file):
+    """
+    Month index (year * 12 + month - 1) of the report a digitized CSV came
+    from, parsed from its XX_YYYY name; -1 if the name has no date
+    """
+    match = re.search(r'(\d+)_(\d{4})', os.path.basename(str(source_file)))
+    if not match:
+        return -1
+    return int(match.group(2)) * 12 + int(match.group(1)) - 1
+
+class VintageIndex:
+    """
+    Every published value of every (Date, age column) point, grouped by point.
+
+    The long table is sorted once by (point, report vintage, row order), so
+    all vintages of a point are one contiguous slice of the value arrays and
+    offsets[key] gives its bounds; key_of maps (Date, age) to that key.
+    """
+    def __init__(self, combined_df, columns=AGE_COLUMNS):
+        self.columns = [c for c in columns if c in combined_df.columns]
+        typed = to_typed_frame(combined_df[['Date', 'Source_File'] + self.columns])
+        typed = typed.dropna(subset=['Date'])
+
+        date_codes, self.dates = pd.factorize(typed['Date'], sort=True)
+        sources = typed['Source_File'].astype(str).to_numpy()
+        values = typed[self.columns].to_numpy(dtype=np.float64)
+
+        # One entry per non-missing (row, age) value, key = date code * n_ages + age
+        rows, cols = np.nonzero(~np.isnan(values))
+        keys = date_codes[rows] * len(self.columns) + cols
+        vintage_of_source = {source: report_vintage(source) for source in np.unique(sources)}
+        vintages = np.array([vintage_of_source[source] for source in sources], dtype=np.int64)[rows]
+        order = np.lexsort((rows, vintages, keys))
+
+        self.keys = keys[order]
+        self.values = values[rows, cols][order]
+        self.vintages = vintages[order]
+        self.sources = sources[rows][order]
+
+        n_keys = len(self.dates) * len(self.columns)
+        self.counts = np.bincount(self.keys, minlength=n_keys)
+        self.offsets = np.concatenate(([0], np.cumsum(self.counts)))
+        self._date_position = {date: i for i, date in enumerate(self.dates)}
+        self._column_position = {column: i for i, column in enumerate(self.columns)}
+
+    def key_of(self, date, column):
+        return self._date_position[pd.Timestamp(date)] * len(self.columns) + self._column_position[column]
+
+    def vintages_of(self, date, column):
+        """All published values of one point, oldest report first, as a DataFrame"""
+        key = self.key_of(date, column)
+        start, end = self.offsets[key], self.offsets[key + 1]
+        return pd.DataFrame({
+            'Source_File': self.sources[start:end],
+            'Vintage': self.vintages[start:end],
+            'Value': self.values[start:end],
+        })
+
+    def consolidate(self, policy='latest'):
+        """
+        One value per (Date, age) for the whole index at once: a DataFrame with
+        Date, one column per age and '{age}_vintages' counts
+        """
+        if policy not in POLICIES:
+            raise ValueError(f"Unknown policy '{policy}', expected one of {POLICIES}")
+        n_keys = len(self.counts)
+        has = self.counts > 0
+        if not has.any():
+            picked = np.full(n_keys, np.nan)
+        elif policy in ('latest', 'earliest'):
+            position = self.offsets[1:] - 1 if policy == 'latest' else self.offsets[:-1]
+            picked = np.where(has, self.values[np.where(has, position, 0)], np.nan)
+        else:
+            stats = grouped_stats(self.values[:, None], self.keys, n_keys)
+            picked = stats[:, 0, STAT_NAMES.index(policy)]
+
+        shape = (len(self.dates), len(self.columns))
+        consolidated = pd.DataFrame(picked.reshape(shape), columns=self.columns)
+        counts = pd.DataFrame(self.counts.reshape(shape), columns=[f'{c}_vintages' for c in self.columns])
+        consolidated.insert(0, 'Date', self.dates)
+        return pd.concat([consolidated, counts], axis=1)
+
+def consolidate_combined_data(policy='latest', output_format='csv'):
+    """Write combined_consolidated_<policy> from the combined dataset"""
+    index = VintageIndex(load_combined_data('csv'))
+    consolidated = index.consolidate(policy)
+    for path in write_table(consolidated, COMBINED_DIR, f"combined_consolidated_{policy}", output_format):
+        print(f"Saved {path}")
+    return consolidated
+
+if __name__ == "__main__":
+    consolidate_combined_data('latest')
@@ -0,0 +1,164 @@
+import cv2
+import numpy as np
+
+# Detections scoring below this are left to the manual cropping UI
+MIN_CONFIDENCE = 0.75
+
+def _runs(mask):
+    """(start, end) index pairs, inclusive, of each run of True values"""
+    idx = np.flatnonzero(mask)
+    if len(idx) == 0:
+        return []
+    breaks = np.flatnonzero(np.diff(idx) > 1)
+    return list(zip(np.r_[idx[0], idx[breaks + 1]], np.r_[idx[breaks], idx[-1]]))
+
+def find_gridlines(nonwhite):
+    """
+    Rows of the evenly spaced horizontal gridlines, top to bottom, as
+    (y, x_start, x_end); the last one is the x axis. Empty if there are
+    fewer than three.
+    """
+    height, width = nonwhite.shape
+    long_lines = cv2.morphologyEx(nonwhite, cv2.MORPH_OPEN,
+                                  cv2.getStructuringElement(cv2.MORPH_RECT, (width // 3, 1)))
+    rows = _runs(long_lines.any(axis=1))
+    centers = np.array([(start + end) / 2 for start, end in rows])
+    
+    # Longest chain of lines a constant spacing apart
+    best = []
+    for i in range(len(centers) - 1, 0, -1):
+        for j in range(i - 1, -1, -1):
+            spacing = centers[i] - centers[j]
+            if spacing < 0.02 * height:
+                continue
+            chain = [i, j]
+            while True:
+                target = centers[chain[-1]] - spacing
+                candidates = [k for k in range(chain[-1]) if abs(centers[k] - target) <= max(2, 0.08 * spacing)]
+                if not candidates:
+                    break
+                chain.append(candidates[-1])
+            if len(chain) > len(best):
+                best = chain
+    if len(best) < 3:
+        return []
+    
+    gridlines = []
+    for k in sorted(best):
+        start, end = rows[k]
+        columns = np.flatnonzero(long_lines[start:end + 1].any(axis=0))
+        gridlines.append((centers[k], columns.min(), columns.max()))
+    return gridlines
+
+def _frame_lines(nonwhite, axis, near, limit):
+    """Index of a border line (>= 60% long) within `limit` pixels of the edge `near`, or None"""
+    coverage = nonwhite.mean(axis=axis)
+    indices = range(limit) if near == 'start' else range(len(coverage) - 1, len(coverage) - 1 - limit, -1)
+    for i in indices:
+        if coverage[i] > 0.6:
+            return i
+    return None
+
+def detect_chart_region(image):
+    """
+    Propose the crop box of the chart in a report image: inside any border
+    frame, down to the bottom of the legend, and from just above the top
+    y-axis label, which leaves out the chart title.
+
+    Returns ((x1, y1, x2, y2), confidence) in the image's pixel coordinates,
+    or (None, 0.0) if no regular gridlines were found.
+    """
+    height, width = image.shape[:2]
+    gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY) if image.ndim == 3 else image
+    nonwhite = (gray < 240).astype(np.uint8)
+    
+    gridlines = find_gridlines(nonwhite)
+    if not gridlines:
+        return None, 0.0
+    spacing = float(np.median(np.diff([y for y, _, _ in gridlines])))
+    top_line, plot_left, _ = gridlines[0]
+    axis_line = gridlines[-1][0]
+    
+    # Sides and bottom: just inside a border frame if there is one, else around the content
+    edge = max(4, width // 40)
+    left = _frame_lines(nonwhite, 0, 'start', edge)
+    right = _frame_lines(nonwhite, 0, 'end', edge)
+    bottom = _frame_lines(nonwhite, 1, 'end', max(4, height // 40))
+    if bottom is not None and bottom <= axis_line + 1:
+        # A chart drawn to the bottom edge: that line is the x axis, not a frame
+        bottom = None
+    framed = sum(side is not None for side in (left, right, bottom))
+    
+    # Tighten to the content, excluding the frame lines and their anti-aliased edge
+    inner_left = left + 2 if left is not None else 0
+    inner_right = right - 1 if right is not None else width
+    inner_bottom = bottom - 1 if bottom is not None else height
+    band = nonwhite[max(0, int(top_line - spacing)):int(axis_line) + 1, inner_left:inner_right]
+    content_columns = np.flatnonzero(band.any(axis=0)) + inner_left
+    content_rows = np.flatnonzero(nonwhite[int(axis_line):inner_bottom, inner_left:inner_right].any(axis=1))
+    if content_columns.size == 0 or content_rows.size == 0:
+        return None, 0.0
+    margin = max(2, int(round(0.1 * spacing)))
+    x1 = max(inner_left, content_columns.min() - margin)
+    x2 = min(inner_right, content_columns.max() + margin + 1)
+    y2 = min(inner_bottom, int(axis_line) + content_rows.max() + margin + 1)
+    
+    # Top: above the label of the top gridline, the run of text rows left of
+    # the plot that is centred on the line (anything higher is the title)
+    window_top = max(0, int(top_line - 0.6 * spacing))
+    dark_rows = (gray[window_top:int(top_line + spacing / 4) + 1, x1:plot_left] < 160).any(axis=1)
+    label = [run for run in _runs(dark_rows) if run[0] + window_top <= top_line <= run[1] + window_top]
+    if label:
+        y1 = window_top + label[0][0] - margin
+    else:
+        y1 = int(top_line - 0.35 * spacing)
+    y1 = max(0, y1)
+    
+    confidence = (0.5 * min(1.0, (len(gridlines) - 2) / 4)
+                  + 0.25 * bool(label)
+                  + 0.25 * framed / 3)
+    if (x2 - x1) * (y2 - y1) < 0.3 * width * height:
+        confidence *= 0.5
+    return (int(x1), int(y1), int(x2), int(y2)), round(confidence, 3)
+
+def resize_for_display(image, max_width=1280, max_height=720):
+    """Image scaled down (never up) to fit max_width x max_height, and the scale factor used"""
+    height, width = image.shape[:2]
+    
+    # Calculate scale factor to fit within max dimensions
+    width_scale = max_width / width if width > max_width else 1.0
+    height_scale = max_height / height if height > max_height else 1.0
+    
+    # Use the smaller scale to ensure image fits within bounds
+    scale_factor = min(width_scale, height_scale)
+    
+    if scale_factor < 1.0:
+        # Only resize if necessary
+        new_width = int(width * scale_factor)
+        new_height = int(height * scale_factor)
+        return cv2.resize(image, (new_width, new_height), interpolation=cv2.INTER_AREA), scale_factor
+    
+    return image.copy(), 1.0
+
+def to_original(roi, scale_factor):
+    """Convert a (x1, y1, x2, y2) box on the display image to original-image coordinates"""
+    if scale_factor == 1.0:
+        return tuple(roi)
+    return tuple(int(v / scale_factor) for v in roi)
+
+def propose_crop(image, max_width=1280, max_height=720):
+    """
+    detect_chart_region run on the display-sized image (much faster, and the
+    same view a person cropping by hand sees); returns (roi in original-image
+    coordinates or None, confidence). A layout the detector can't handle
+    gives (None, 0.0), i.e. crop by hand, rather than an exception.
+    """
+    display, scale_factor = resize_for_display(image, max_width, max_height)
+    try:
+        roi, confidence = detect_chart_region(display)
+    except Exception as e:
+        print(f"Chart region detection failed: {e}")
+        return None, 0.0
+    if roi is None:
+        return None, 0.0
+    return to_original(roi, scale_factor), confidence
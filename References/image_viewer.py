@@ -1,9 +1,19 @@
 import os
 import re
+import queue
+import bisect
+import hashlib
+import threading
+from collections import OrderedDict
 import tkinter as tk
 from tkinter import Button, Label, Entry, Frame, Scrollbar
 from PIL import Image, ImageTk
 
+THUMBNAIL_SIZE = (350, 350)
+THUMBNAIL_CACHE_DIR = r"C:\Users\clint\Desktop\Lifecycle_RA\Data\Processed\Thumbnail_Cache"
+# Upper bound on the decoded thumbnails kept as PhotoImages (Tk holds 4 bytes per pixel)
+PHOTO_CACHE_BYTES = 128 * 1024 * 1024
+
 def extract_date(filename):
     # Extract month and year from filename pattern
     match = re.search(r'(\d+)_(\d{4})', filename)
@@ -14,12 +24,142 @@ def extract_date(filename):
         return f"{year}_{month}"
     return filename
 
+class DateIndex:
+    """
+    Sorted ((year, month), position) entries for every file whose name has a
+    month_year date, built once with extract_date so date searches are a
+    binary search instead of a scan of the file list
+    """
+    def __init__(self, image_files):
+        self.entries = []
+        for position, filename in enumerate(image_files):
+            date = extract_date(filename)
+            if date == filename:
+                continue  # No date in the name
+            year, month = date.split('_')
+            self.entries.append(((int(year), int(month)), position))
+        self.entries.sort()
+        # Earliest image of each calendar month, for searches without a year
+        self.first_of_month = {}
+        for (_, month), position in self.entries:
+            self.first_of_month.setdefault(month, position)
+    
+    def find(self, year=None, month=None):
+        """
+        Position of the first image from (year, month), or failing that the
+        first one after it; with only a year, that year's first image; with
+        only a month, the earliest image from that month. None if nothing matches.
+        """
+        if year is None:
+            return self.first_of_month.get(month)
+        i = bisect.bisect_left(self.entries, ((year, month or 0), -1))
+        if i == len(self.entries):
+            return None
+        return self.entries[i][1]
+
+def thumbnail_cache_path(img_path, size=THUMBNAIL_SIZE, cache_dir=THUMBNAIL_CACHE_DIR):
+    """Cache file for a thumbnail of img_path; a new path whenever the image is modified"""
+    stat = os.stat(img_path)
+    key = f"{os.path.abspath(img_path)}|{stat.st_mtime_ns}|{stat.st_size}|{size[0]}x{size[1]}"
+    return os.path.join(cache_dir, hashlib.sha1(key.encode('utf-8')).hexdigest() + ".png")
+
+def load_thumbnail(img_path, size=THUMBNAIL_SIZE, cache_dir=THUMBNAIL_CACHE_DIR):
+    """
+    Thumbnail of img_path as a loaded PIL image, read from the on-disk cache
+    or decoded (at reduced resolution where the format supports it) and cached
+    """
+    cache_path = thumbnail_cache_path(img_path, size, cache_dir)
+    if os.path.isfile(cache_path):
+        try:
+            with Image.open(cache_path) as cached:
+                cached.load()
+                return cached
+        except OSError:
+            pass  # Unreadable cache file, decode the original again
+    
+    with Image.open(img_path) as img:
+        # Let the decoder skip detail we throw away (JPEG decodes at 1/2, 1/4 or 1/8 scale)
+        img.draft('RGB', size)
+        img.thumbnail(size)
+        thumb = img.copy()
+    
+    os.makedirs(cache_dir, exist_ok=True)
+    tmp_path = f"{cache_path}.{threading.get_ident()}.tmp"
+    try:
+        thumb.save(tmp_path, format="PNG", compress_level=1)
+        os.replace(tmp_path, cache_path)
+    except OSError as e:
+        print(f"Could not cache thumbnail for {os.path.basename(img_path)}: {e}")
+    return thumb
+
+class PhotoCache:
+    """LRU of PhotoImages by image path, evicting the least recently shown once max_bytes is exceeded"""
+    def __init__(self, max_bytes=PHOTO_CACHE_BYTES):
+        self.max_bytes = max_bytes
+        self.bytes = 0
+        self._photos = OrderedDict()
+    
+    def __contains__(self, path):
+        return path in self._photos
+    
+    def get(self, path):
+        photo = self._photos.get(path)
+        if photo is not None:
+            self._photos.move_to_end(path)
+        return photo
+    
+    def put(self, path, photo):
+        if path in self._photos:
+            self.bytes -= self._size(self._photos.pop(path))
+        self._photos[path] = photo
+        self.bytes += self._size(photo)
+        # Always keep the newest, even if it alone is over the limit
+        while self.bytes > self.max_bytes and len(self._photos) > 1:
+            _, evicted = self._photos.popitem(last=False)
+            self.bytes -= self._size(evicted)
+    
+    @staticmethod
+    def _size(photo):
+        return photo.width() * photo.height() * 4
+
+class ThumbnailPrefetcher:
+    """
+    Background thread that decodes thumbnails ahead of time.
+
+    request() replaces any pending work with a new list of paths; decoded
+    (path, PIL image) pairs are put on .ready for the Tk thread to turn into
+    PhotoImages, since Tk objects may only be created on that thread.
+    """
+    def __init__(self, size=THUMBNAIL_SIZE, cache_dir=THUMBNAIL_CACHE_DIR):
+        self.size = size
+        self.cache_dir = cache_dir
+        self.ready = queue.Queue()
+        self._requests = queue.Queue()
+        self._generation = 0
+        threading.Thread(target=self._run, name="thumbnail-prefetch", daemon=True).start()
+    
+    def request(self, paths):
+        self._generation += 1
+        self._requests.put((self._generation, list(paths)))
+    
+    def _run(self):
+        while True:
+            generation, paths = self._requests.get()
+            for path in paths:
+                if generation != self._generation:
+                    break  # Superseded by a newer page change
+                try:
+                    self.ready.put((path, load_thumbnail(path, self.size, self.cache_dir)))
+                except Exception as e:
+                    print(f"Could not prefetch {os.path.basename(path)}: {e}")
+
 def view_images():
     folder_path = r"C:\Users\clint\Desktop\Lifecycle_RA\Data\Processed\Sorted_Images"
     
     # Get all image files and sort them chronologically
     image_files = [f for f in os.listdir(folder_path) if f.lower().endswith(('.png', '.jpg', '.jpeg'))]
     image_files.sort(key=extract_date)
+    date_index = DateIndex(image_files)
     
     if not image_files:
         print("No images found in the folder.")
@@ -29,6 +169,10 @@ def view_images():
     grid_rows, grid_cols = 2, 4
     grid_size = grid_rows * grid_cols
     
+    # Thumbnails shown or prefetched, and the thread that decodes the neighbouring pages
+    photos = PhotoCache()
+    prefetcher = ThumbnailPrefetcher()
+    
     # Page control
     current_page = [0]  # Using list to make it mutable in nested functions
     total_pages = (len(image_files) + grid_size - 1) // grid_size  # Ceiling division
@@ -80,23 +224,28 @@ def view_images():
         
         if not year and not month:
             return
+        try:
+            year = int(year) if year else None
+            month = int(month) if month else None
+        except ValueError:
+            print(f"Not a valid year/month: {year_entry.get()} {month_entry.get()}")
+            return
         
         # Find matching index
-        for i, filename in enumerate(image_files):
-            search_pattern = f"{month}_" if month else ""
-            search_pattern += f"{year}" if year else ""
-            
-            if search_pattern in filename:
-                page = i // grid_size
-                show_page(page)
-                break
+        i = date_index.find(year, month)
+        if i is None:
+            print("No images from that date or later")
+            return
+        show_page(i // grid_size)
     
     Button(search_frame, text="Search", command=search_by_date).pack(side=tk.LEFT, padx=10)
     
-    # Image grid frames (2x4)
+    # Image grid frames (2x4), created once and reused for every page
     image_frames = []
     image_labels = []
     filename_labels = []
+    # Image path each cell currently shows, so unchanged cells are left alone
+    cell_paths = [None] * grid_size
     
     for r in range(grid_rows):
         row_frame = Frame(scrollable_frame)
@@ -133,36 +282,59 @@ def view_images():
             start_idx = page_num * grid_size
             end_idx = min(start_idx + grid_size, len(image_files))
             
-            # Clear all image labels first
-            for img_label in image_labels:
-                img_label.config(image='')
-                img_label.image = None
-            
-            for name_label in filename_labels:
-                name_label.config(text='')
+            # Blank only the cells past the last image
+            for grid_idx in range(end_idx - start_idx, grid_size):
+                if cell_paths[grid_idx] is not None:
+                    image_labels[grid_idx].config(image='')
+                    image_labels[grid_idx].image = None
+                    filename_labels[grid_idx].config(text='')
+                    cell_paths[grid_idx] = None
             
-            # Load images for the current page
+            # Load images for the current page into the existing cells
             for i in range(start_idx, end_idx):
                 grid_idx = i - start_idx
                 img_path = os.path.join(folder_path, image_files[i])
+                if cell_paths[grid_idx] == img_path:
+                    continue
+                cell_paths[grid_idx] = img_path
                 
                 try:
-                    # Display the image
-                    img = Image.open(img_path)
-                    # Adjusted thumbnail size for 2x4 grid
-                    img.thumbnail((350, 350))  # Slightly smaller to fit 4 columns
-                    
-                    photo = ImageTk.PhotoImage(img)
+                    # Display the image, decoding it now only if it was not prefetched
+                    photo = photos.get(img_path)
+                    if photo is None:
+                        photo = ImageTk.PhotoImage(load_thumbnail(img_path))
+                        photos.put(img_path, photo)
                     image_labels[grid_idx].config(image=photo)
                     image_labels[grid_idx].image = photo  # Keep a reference
                     
                     # Update filename display
                     filename_labels[grid_idx].config(text=image_files[i])
                 except Exception as e:
+                    image_labels[grid_idx].config(image='')
+                    image_labels[grid_idx].image = None
                     filename_labels[grid_idx].config(text=f"Error: {e}")
             
             # Update page label
             page_label.config(text=f"Page {page_num + 1} of {total_pages}")
+            
+            # Decode the next page, then the previous one, in the background
+            neighbours = []
+            for page in (page_num + 1, page_num - 1):
+                if 0 <= page < total_pages:
+                    neighbours.extend(image_files[page * grid_size:(page + 1) * grid_size])
+            prefetcher.request(path for path in (os.path.join(folder_path, f) for f in neighbours)
+                               if path not in photos)
+    
+    def collect_prefetched():
+        # Turn thumbnails decoded by the prefetch thread into PhotoImages on the Tk thread
+        try:
+            while True:
+                path, img = prefetcher.ready.get_nowait()
+                if path not in photos:
+                    photos.put(path, ImageTk.PhotoImage(img))
+        except queue.Empty:
+            pass
+        root.after(50, collect_prefetched)
     
     def next_page():
         show_page(current_page[0] + 1)
@@ -185,6 +357,9 @@ def view_images():
     def show_full_image(idx):
         nonlocal preview_window
         
+        if idx >= len(image_files):
+            return  # Empty cell on the last page
+        
         if preview_window is not None:
             preview_window.destroy()
         
@@ -226,6 +401,7 @@ def view_images():
     
     # Show first page
     show_page(0)
+    collect_prefetched()
     
     root.mainloop()
 
@@ -1,14 +1,301 @@
 import os
+import sys
+import json
+import time
+import argparse
 import cv2
 import numpy as np
+from datetime import datetime
+from concurrent.futures import ProcessPoolExecutor
 from tkinter import Tk, messagebox
 
+from chart_region import MIN_CONFIDENCE, resize_for_display, to_original, propose_crop
+
+SORTED_IMAGES_DIR = r"C:\Users\clint\Desktop\Lifecycle_RA\Data\Processed\Sorted_Images"
+# Saved next to the cropped images; one crop rectangle per source image
+CROP_MANIFEST_NAME = "crop_manifest.json"
+
+def default_output_folder(folder_path):
+    """Data/cropped_sorted for Data/Processed/Sorted_Images"""
+    return os.path.join(os.path.dirname(os.path.dirname(folder_path)), "cropped_sorted")
+
+def cropped_name(image_file):
+    filename, ext = os.path.splitext(image_file)
+    return f"{filename}_cropped{ext}"
+
+def load_crop_manifest(manifest_path):
+    """{source file name: entry} from the manifest, empty if there is none yet"""
+    if not os.path.isfile(manifest_path):
+        return {}
+    with open(manifest_path, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+def save_crop_manifest(manifest, manifest_path):
+    tmp_path = manifest_path + ".tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+    os.replace(tmp_path, manifest_path)
+
+def clamp_roi(roi, width, height):
+    """Clip (x1, y1, x2, y2) to the image; None if nothing is left"""
+    x1, y1, x2, y2 = roi
+    x1, x2 = max(0, min(x1, width)), max(0, min(x2, width))
+    y1, y2 = max(0, min(y1, height)), max(0, min(y2, height))
+    if x2 <= x1 or y2 <= y1:
+        return None
+    return (x1, y1, x2, y2)
+
+def crop_entry(roi, image_shape, image_path, method='manual', confidence=None):
+    """
+    Manifest entry for a crop of image_path, in original-image pixel
+    coordinates; method is 'manual', 'auto' (detected), 'confirmed' (a
+    detected crop accepted in the UI) or 'recovered'
+    """
+    height, width = image_shape[:2]
+    entry = {
+        'roi': list(roi),
+        'source_size': [width, height],
+        'source_mtime_ns': os.stat(image_path).st_mtime_ns,
+        'output': cropped_name(os.path.basename(image_path)),
+        'cropped_at': datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+        'method': method,
+    }
+    if confidence is not None:
+        entry['confidence'] = confidence
+    return entry
+
+def apply_crop(image_path, entry, output_folder):
+    """
+    Re-crop one image from its manifest entry; returns (image file, status).
+
+    If the image was replaced by one of a different size, the rectangle is
+    scaled to the new size.
+    """
+    image_file = os.path.basename(image_path)
+    image = cv2.imread(image_path)
+    if image is None:
+        return image_file, "unreadable"
+    height, width = image.shape[:2]
+    x1, y1, x2, y2 = entry['roi']
+    source_width, source_height = entry.get('source_size', (width, height))
+    status = "cropped"
+    if (source_width, source_height) != (width, height):
+        sx, sy = width / source_width, height / source_height
+        x1, x2 = round(x1 * sx), round(x2 * sx)
+        y1, y2 = round(y1 * sy), round(y2 * sy)
+        status = f"cropped (rescaled from {source_width}x{source_height} to {width}x{height})"
+    roi = clamp_roi((x1, y1, x2, y2), width, height)
+    if roi is None:
+        return image_file, "empty crop rectangle"
+    x1, y1, x2, y2 = roi
+    output_path = os.path.join(output_folder, entry.get('output') or cropped_name(image_file))
+    if not cv2.imwrite(output_path, image[y1:y2, x1:x2]):
+        return image_file, "could not write"
+    return image_file, status
+
+def locate_crop(image_path, cropped_path, scale=4, margin=8):
+    """
+    Find where an existing cropped image was cut from its source; returns
+    (image file, entry or None). Matched coarsely at 1/scale resolution,
+    then exactly at full resolution near the coarse hit.
+    """
+    image_file = os.path.basename(image_path)
+    image, crop = cv2.imread(image_path), cv2.imread(cropped_path)
+    if image is None or crop is None:
+        return image_file, None
+    height, width = crop.shape[:2]
+    if height > image.shape[0] or width > image.shape[1]:
+        return image_file, None
+    
+    if min(height, width) >= 8 * scale:
+        small_image = cv2.resize(image, None, fx=1 / scale, fy=1 / scale, interpolation=cv2.INTER_AREA)
+        small_crop = cv2.resize(crop, None, fx=1 / scale, fy=1 / scale, interpolation=cv2.INTER_AREA)
+        _, _, (x, y), _ = cv2.minMaxLoc(cv2.matchTemplate(small_image, small_crop, cv2.TM_SQDIFF))
+        x, y = x * scale, y * scale
+    else:
+        _, _, (x, y), _ = cv2.minMaxLoc(cv2.matchTemplate(image, crop, cv2.TM_SQDIFF))
+        margin = 0
+    
+    # The crop is an exact copy of the source pixels: test positions around the hit,
+    # checking the middle row first (edge rows are often plain background)
+    middle = height // 2
+    for y0 in range(max(0, y - margin), min(image.shape[0] - height, y + margin) + 1):
+        for x0 in range(max(0, x - margin), min(image.shape[1] - width, x + margin) + 1):
+            if (np.array_equal(image[y0 + middle, x0:x0 + width], crop[middle])
+                    and np.array_equal(image[y0:y0 + height, x0:x0 + width], crop)):
+                x, y = x0, y0
+                break
+        else:
+            continue
+        break
+    else:
+        return image_file, None
+    entry = crop_entry((x, y, x + width, y + height), image.shape, image_path, method='recovered')
+    entry['output'] = os.path.basename(cropped_path)
+    # When the cropped file was written, not when it was recovered
+    entry['cropped_at'] = datetime.fromtimestamp(os.path.getmtime(cropped_path)).strftime("%Y-%m-%d %H:%M:%S")
+    return image_file, entry
+
+def recover_crop_manifest(folder_path=SORTED_IMAGES_DIR, output_folder=None, manifest_path=None, workers=None):
+    """
+    Add manifest entries for cropped images made before the manifest existed,
+    by finding each crop in its source image. Returns the number recovered.
+
+    The manifest records this machine's file mtimes, so it is not committed:
+    run `python img_errors_fix_img_to_csv.py --recover` once wherever the
+    cropped images already exist, before using --replay. Recovered entries
+    have method 'recovered' and the cropped file's mtime as cropped_at.
+    """
+    output_folder = output_folder or default_output_folder(folder_path)
+    manifest_path = manifest_path or os.path.join(output_folder, CROP_MANIFEST_NAME)
+    manifest = load_crop_manifest(manifest_path)
+    known_outputs = {entry.get('output') for entry in manifest.values()}
+    
+    jobs = []
+    for image_file in sorted(os.listdir(folder_path)):
+        output_name = cropped_name(image_file)
+        cropped_path = os.path.join(output_folder, output_name)
+        if image_file not in manifest and output_name not in known_outputs and os.path.isfile(cropped_path):
+            jobs.append((os.path.join(folder_path, image_file), cropped_path))
+    
+    recovered = 0
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        for image_file, entry in executor.map(locate_crop, *zip(*jobs)) if jobs else []:
+            if entry is None:
+                print(f"Could not locate the crop of {image_file}")
+                continue
+            manifest[image_file] = entry
+            recovered += 1
+    if recovered:
+        save_crop_manifest(manifest, manifest_path)
+    print(f"Recovered {recovered} of {len(jobs)} crop rectangles into {manifest_path}")
+    return recovered
+
+def replay_crops(folder_path=SORTED_IMAGES_DIR, output_folder=None, manifest_path=None, workers=None,
+                 changed_only=False):
+    """
+    Headless re-crop of every image in the manifest, in parallel worker processes.
+
+    With changed_only, images whose file is unchanged since their crop and
+    whose cropped output still exists are skipped. Returns {status: count}.
+    """
+    output_folder = output_folder or default_output_folder(folder_path)
+    manifest_path = manifest_path or os.path.join(output_folder, CROP_MANIFEST_NAME)
+    manifest = load_crop_manifest(manifest_path)
+    if not manifest:
+        print(f"No crops recorded in {manifest_path}")
+        return {}
+    os.makedirs(output_folder, exist_ok=True)
+    
+    jobs = []
+    counts = {}
+    for image_file, entry in sorted(manifest.items()):
+        image_path = os.path.join(folder_path, image_file)
+        if not os.path.isfile(image_path):
+            print(f"Missing source image: {image_file}")
+            counts['missing'] = counts.get('missing', 0) + 1
+            continue
+        output_path = os.path.join(output_folder, entry.get('output') or cropped_name(image_file))
+        if (changed_only and os.path.isfile(output_path)
+                and os.stat(image_path).st_mtime_ns == entry.get('source_mtime_ns')):
+            counts['unchanged'] = counts.get('unchanged', 0) + 1
+            continue
+        jobs.append((image_path, entry))
+    
+    started = time.perf_counter()
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = [executor.submit(apply_crop, image_path, entry, output_folder) for image_path, entry in jobs]
+        for future in futures:
+            image_file, status = future.result()
+            if status != "cropped":
+                print(f"{image_file}: {status}")
+            key = status.split(' (')[0]
+            counts[key] = counts.get(key, 0) + 1
+    print(f"Re-cropped {counts.get('cropped', 0)} of {len(manifest)} images into {output_folder} "
+          f"in {time.perf_counter() - started:.1f}s: {counts}")
+    return counts
+
+def auto_crop_one(image_path, output_folder, min_confidence=MIN_CONFIDENCE):
+    """
+    Detect the chart region of one image and, if the detection is confident
+    enough, save the crop; returns (image file, entry or None, roi, confidence)
+    """
+    image_file = os.path.basename(image_path)
+    image = cv2.imread(image_path)
+    if image is None:
+        return image_file, None, None, 0.0
+    roi, confidence = propose_crop(image)
+    if roi is None or confidence < min_confidence:
+        return image_file, None, roi, confidence
+    roi = clamp_roi(roi, image.shape[1], image.shape[0])
+    if roi is None:
+        return image_file, None, None, 0.0
+    x1, y1, x2, y2 = roi
+    if not cv2.imwrite(os.path.join(output_folder, cropped_name(image_file)), image[y1:y2, x1:x2]):
+        return image_file, None, roi, confidence
+    return image_file, crop_entry(roi, image.shape, image_path, method='auto', confidence=confidence), roi, confidence
+
+def auto_crop(folder_path=SORTED_IMAGES_DIR, output_folder=None, manifest_path=None, min_confidence=MIN_CONFIDENCE,
+              workers=None, redo=False):
+    """
+    Headless batch crop: detect the chart region of every image not yet in
+    the manifest (every image with redo) in parallel worker processes, save
+    the confident ones and record them in the manifest.
+
+    Returns {image file: (proposed roi or None, confidence)} for the images
+    left for manual cropping.
+    """
+    output_folder = output_folder or default_output_folder(folder_path)
+    manifest_path = manifest_path or os.path.join(output_folder, CROP_MANIFEST_NAME)
+    os.makedirs(output_folder, exist_ok=True)
+    manifest = load_crop_manifest(manifest_path)
+    
+    valid_extensions = ['.jpg', '.jpeg', '.png', '.bmp', '.tiff', '.gif']
+    image_files = sorted(f for f in os.listdir(folder_path)
+                         if os.path.splitext(f)[1].lower() in valid_extensions and (redo or f not in manifest))
+    
+    started = time.perf_counter()
+    low_confidence = {}
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = [executor.submit(auto_crop_one, os.path.join(folder_path, f), output_folder, min_confidence)
+                   for f in image_files]
+        for image_file, future in zip(image_files, futures):
+            # One bad image must not cost the crops the other workers already saved
+            try:
+                image_file, entry, roi, confidence = future.result()
+            except Exception as e:
+                print(f"Could not auto-crop {image_file}: {e}")
+                entry, roi, confidence = None, None, 0.0
+            if entry is None:
+                low_confidence[image_file] = (roi, confidence)
+            else:
+                manifest[image_file] = entry
+    if len(low_confidence) < len(image_files):
+        save_crop_manifest(manifest, manifest_path)
+    print(f"Auto-cropped {len(image_files) - len(low_confidence)} of {len(image_files)} images "
+          f"in {time.perf_counter() - started:.1f}s; {len(low_confidence)} need manual cropping")
+    for image_file, (roi, confidence) in sorted(low_confidence.items()):
+        print(f"  {image_file} (confidence {confidence:.2f})")
+    return low_confidence
+
 class ImageCropper:
-    def __init__(self, folder_path):
+    """
+    Interactive cropping of the images in folder_path (or just image_files).
+
+    proposals ({image file: (roi, confidence)}, e.g. from auto_crop) or
+    auto_detect=True pre-fill each image with a detected crop box, which 'c'
+    accepts as is; dragging a new rectangle replaces it.
+    """
+    def __init__(self, folder_path, image_files=None, proposals=None, auto_detect=False):
         self.folder_path = folder_path
-        self.output_folder = os.path.join(os.path.dirname(os.path.dirname(folder_path)), "cropped_sorted")
+        self.output_folder = default_output_folder(folder_path)
         self._ensure_output_folder_exists()
-        self.image_files = self._get_image_files()
+        # Every crop rectangle chosen so far, so the crops can be replayed without the clicks
+        self.manifest_path = os.path.join(self.output_folder, CROP_MANIFEST_NAME)
+        self.manifest = load_crop_manifest(self.manifest_path)
+        self.image_files = sorted(image_files) if image_files is not None else self._get_image_files()
+        self.proposals = proposals or {}
+        self.auto_detect = auto_detect
         self.current_index = 0
         self.current_image = None
         self.original_image = None
@@ -17,6 +304,8 @@ class ImageCropper:
         self.x_start, self.y_start = -1, -1
         self.x_end, self.y_end = -1, -1
         self.crop_roi = None
+        # How crop_roi was chosen, recorded in the manifest
+        self.crop_method, self.crop_confidence = 'manual', None
         self.scale_factor = 1.0
         self.window_name = "Image Cropping Tool"
         cv2.namedWindow(self.window_name, cv2.WINDOW_NORMAL)
@@ -41,24 +330,8 @@ class ImageCropper:
     
     def _resize_image_for_display(self, image, max_width=1280, max_height=720):
         """Resize image to fit screen while maintaining aspect ratio."""
-        height, width = image.shape[:2]
-        
-        # Calculate scale factor to fit within max dimensions
-        width_scale = max_width / width if width > max_width else 1.0
-        height_scale = max_height / height if height > max_height else 1.0
-        
-        # Use the smaller scale to ensure image fits within bounds
-        self.scale_factor = min(width_scale, height_scale)
-        
-        if self.scale_factor < 1.0:
-            # Only resize if necessary
-            new_width = int(width * self.scale_factor)
-            new_height = int(height * self.scale_factor)
-            resized = cv2.resize(image, (new_width, new_height), interpolation=cv2.INTER_AREA)
-            return resized
-        
-        self.scale_factor = 1.0
-        return image.copy()
+        resized, self.scale_factor = resize_for_display(image, max_width, max_height)
+        return resized
     
     def _mouse_callback(self, event, x, y, flags, param):
         """Handle mouse events for cropping."""
@@ -83,15 +356,8 @@ class ImageCropper:
             x2, y2 = max(self.x_start, self.x_end), max(self.y_start, self.y_end)
             
             # Save crop region and convert to original image coordinates
-            if self.scale_factor != 1.0:
-                # Convert display coordinates to original image coordinates
-                x1_orig = int(x1 / self.scale_factor)
-                y1_orig = int(y1 / self.scale_factor)
-                x2_orig = int(x2 / self.scale_factor)
-                y2_orig = int(y2 / self.scale_factor)
-                self.crop_roi = (x1_orig, y1_orig, x2_orig, y2_orig)
-            else:
-                self.crop_roi = (x1, y1, x2, y2)
+            self.crop_roi = to_original((x1, y1, x2, y2), self.scale_factor)
+            self.crop_method, self.crop_confidence = 'manual', None
             
             # Draw final rectangle
             self.current_image = self.display_image.copy()
@@ -130,6 +396,18 @@ class ImageCropper:
             self.display_image = self._resize_image_for_display(self.original_image)
             self.current_image = self.display_image.copy()
             self.crop_roi = None
+            self.crop_method, self.crop_confidence = 'manual', None
+            
+            # Pre-fill a detected crop box
+            proposal = self.proposals.get(self.image_files[self.current_index])
+            if proposal is None and self.auto_detect:
+                proposal = propose_crop(self.original_image)
+            if proposal is not None and proposal[0] is not None:
+                self.crop_roi = proposal[0]
+                self.crop_method, self.crop_confidence = 'confirmed', proposal[1]
+                x1, y1, x2, y2 = (int(v * self.scale_factor) for v in self.crop_roi)
+                cv2.rectangle(self.current_image, (x1, y1), (x2, y2), (0, 255, 0), 2)
+                print(f"Proposed crop (confidence {proposal[1]:.2f}): 'c' to accept or drag a new region")
             
             # Print information about the image and scaling
             orig_h, orig_w = self.original_image.shape[:2]
@@ -158,17 +436,25 @@ class ImageCropper:
                 
                 # 'c' - Crop the image if a region is selected
                 elif key == ord('c') and self.crop_roi is not None:
-                    x1, y1, x2, y2 = self.crop_roi
+                    roi = clamp_roi(self.crop_roi, orig_w, orig_h)
+                    if roi is None:
+                        print("Selected region is empty, select again")
+                        continue
+                    x1, y1, x2, y2 = roi
                     cropped_img = self.original_image[y1:y2, x1:x2]
                     
                     # Generate output path in the dedicated folder
-                    filename, ext = os.path.splitext(self.image_files[self.current_index])
-                    output_path = os.path.join(self.output_folder, f"{filename}_cropped{ext}")
+                    output_path = os.path.join(self.output_folder, cropped_name(self.image_files[self.current_index]))
                     
                     # Save the cropped image
                     cv2.imwrite(output_path, cropped_img)
                     print(f"Saved cropped image to: {output_path}")
                     
+                    # Record the rectangle so the crop can be replayed
+                    self.manifest[self.image_files[self.current_index]] = crop_entry(
+                        roi, self.original_image.shape, image_path, self.crop_method, self.crop_confidence)
+                    save_crop_manifest(self.manifest, self.manifest_path)
+                    
                     self.current_index += 1
                     break
                 
@@ -177,6 +463,7 @@ class ImageCropper:
                     print("Resetting crop selection")
                     self.current_image = self.display_image.copy()
                     self.crop_roi = None
+                    self.crop_method, self.crop_confidence = 'manual', None
                 
                 # 'i' - Show instructions again
                 elif key == ord('i'):
@@ -191,8 +478,37 @@ class ImageCropper:
         cv2.destroyAllWindows()
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Crop chart images by hand, or replay recorded crops")
+    parser.add_argument("--replay", action="store_true",
+                        help=f"re-apply every crop in {CROP_MANIFEST_NAME} without opening a window")
+    parser.add_argument("--recover", action="store_true",
+                        help="record the rectangles of existing cropped images that are not in the manifest yet "
+                             "(run once on a machine with older crops, before --replay)")
+    parser.add_argument("--auto", action="store_true",
+                        help="detect and save the chart crop of every image not in the manifest yet, "
+                             "then open the cropping window only for low-confidence detections")
+    parser.add_argument("--headless", action="store_true", help="with --auto, never open the cropping window")
+    parser.add_argument("--redo", action="store_true", help="with --auto, also re-detect images already cropped")
+    parser.add_argument("--min-confidence", type=float, default=MIN_CONFIDENCE,
+                        help="detections below this are left for manual cropping")
+    parser.add_argument("--changed-only", action="store_true", help="with --replay, skip images unchanged since cropping")
+    parser.add_argument("--workers", type=int, default=None, help="worker processes for --replay")
+    args = parser.parse_args()
+    
     # Path to the folder containing images
-    image_folder = r"C:\Users\clint\Desktop\Lifecycle_RA\Data\Processed\Sorted_Images"
+    image_folder = SORTED_IMAGES_DIR
+    
+    if args.recover:
+        recover_crop_manifest(image_folder, workers=args.workers)
+    if args.replay:
+        replay_crops(image_folder, workers=args.workers, changed_only=args.changed_only)
+    if args.auto:
+        low_confidence = auto_crop(image_folder, min_confidence=args.min_confidence, workers=args.workers,
+                                   redo=args.redo)
+        if low_confidence and not args.headless:
+            ImageCropper(image_folder, image_files=list(low_confidence), proposals=low_confidence).run()
+    if args.recover or args.replay or args.auto:
+        sys.exit(0)
     
     # Check if the folder exists
     if not os.path.exists(image_folder):
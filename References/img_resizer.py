@@ -1,6 +1,8 @@
 import os
+import sys
 import cv2
-import numpy as np
+
+from chart_region import MIN_CONFIDENCE, propose_crop
 
 # Directory containing images
 image_dir = r"C:\Users\clint\Desktop\Lifecycle_RA\Data\Processed\Sorted_Images"
@@ -22,7 +24,16 @@ def mouse_callback(event, x, y, flags, param):
         click_done = True
         print(f"Point clicked at y = {y}")
 
-def process_images():
+def process_images(auto=False, headless=False, min_confidence=MIN_CONFIDENCE):
+    """
+    Crop each image below a chosen y coordinate.
+
+    With auto, the line is put just above the detected chart region (see
+    chart_region.detect_chart_region) and confident detections are saved
+    without asking; only the rest are shown for keep/delete and a click.
+    With headless as well, no window is opened and the low-confidence images
+    are listed instead.
+    """
     global clicked_y, click_done
     
     # Get list of all image files
@@ -32,9 +43,11 @@ def process_images():
         print("No image files found in the directory.")
         return
     
-    cv2.namedWindow("Image")
-    cv2.setMouseCallback("Image", mouse_callback)
+    if not headless:
+        cv2.namedWindow("Image")
+        cv2.setMouseCallback("Image", mouse_callback)
     
+    manual = []
     for image_file in image_files:
         image_path = os.path.join(image_dir, image_file)
         image = cv2.imread(image_path)
@@ -43,6 +56,17 @@ def process_images():
             print(f"Could not open or find the image: {image_file}")
             continue
         
+        if auto:
+            roi, confidence = propose_crop(image)
+            if roi is not None and confidence >= min_confidence:
+                output_path = os.path.join(output_dir, f"cropped_{image_file}")
+                cv2.imwrite(output_path, image[roi[1]:, :])
+                print(f"Cropped {image_file} at detected y = {roi[1]} (confidence {confidence:.2f})")
+                continue
+            manual.append((image_file, confidence))
+            if headless:
+                continue
+        
         # Display the image
         cv2.imshow("Image", image)
         print(f"Processing image: {image_file}")
@@ -82,8 +106,15 @@ def process_images():
         cv2.imwrite(output_path, cropped_image)
         print(f"Saved cropped image to {output_path}")
     
-    cv2.destroyAllWindows()
+    if not headless:
+        cv2.destroyAllWindows()
+    if manual:
+        print(f"{len(manual)} images had no confident detection"
+              + (" and were skipped:" if headless else ":"))
+        for image_file, confidence in manual:
+            print(f"  {image_file} (confidence {confidence:.2f})")
     print("All images processed.")
 
 if __name__ == "__main__":
-    process_images()
+    # --auto: detect the crop line; --headless: never open a window
+    process_images(auto="--auto" in sys.argv or "--headless" in sys.argv, headless="--headless" in sys.argv)
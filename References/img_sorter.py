@@ -1,6 +1,11 @@
 import os
+import json
+import time
 import shutil
+import numpy as np
 import tkinter as tk
+from datetime import datetime
+from concurrent.futures import ProcessPoolExecutor
 from tkinter import messagebox
 from PIL import Image, ImageTk
 
@@ -8,6 +13,15 @@ from PIL import Image, ImageTk
 source_dir = r"C:\Users\clint\Desktop\Lifecycle_RA\Images"
 dest_dir = r"C:\Users\clint\Desktop\Lifecycle_RA\Sorted_Images"
 
+# Keep/discard decisions by perceptual hash, and hashes by file, kept between runs
+decisions_path = os.path.join(os.path.dirname(dest_dir), "sort_decisions.json")
+hash_cache_path = os.path.join(os.path.dirname(dest_dir), "sort_hashes.json")
+
+# Hamming distances between 256-bit hashes: re-exports of the same chart
+# differ by at most a few bits, the same chart type in another month by 8+
+DUPLICATE_DISTANCE = 4
+SIMILAR_DISTANCE = 16
+
 # Create destination directory if it doesn't exist
 if not os.path.exists(dest_dir):
     os.makedirs(dest_dir)
@@ -24,12 +38,177 @@ if not image_files:
     print("No image files found in the source directory.")
     exit()
 
+def _dct_matrix(n):
+    """Orthonormal DCT-II basis, so dct(a) = M @ a @ M.T"""
+    k = np.arange(n)[:, None]
+    i = np.arange(n)[None, :]
+    matrix = np.cos(np.pi * (2 * i + 1) * k / (2 * n)) * np.sqrt(2 / n)
+    matrix[0] /= np.sqrt(2)
+    return matrix
+
+_DCT_64 = _dct_matrix(64)
+
+def perceptual_hash(path):
+    """
+    256-bit DCT hash of an image as a hex string: the signs, relative to
+    their median, of the 16x16 lowest frequencies of a 64x64 grayscale copy
+    """
+    with Image.open(path) as img:
+        img.draft('L', (128, 128))
+        pixels = np.asarray(img.convert('L').resize((64, 64), Image.LANCZOS), dtype=np.float64)
+    coefficients = (_DCT_64 @ pixels @ _DCT_64.T)[:16, :16].ravel()
+    # The DC term only reflects overall brightness, leave it out of the median
+    return np.packbits(coefficients > np.median(coefficients[1:])).tobytes().hex()
+
+def _hash_file(path):
+    try:
+        return perceptual_hash(path)
+    except Exception as e:
+        print(f"Could not hash {os.path.basename(path)}: {e}")
+        return None
+
+def compute_hashes(files, folder=source_dir, cache_path=hash_cache_path, workers=None):
+    """
+    {file: hex hash or None} for files in folder. Hashes are cached by file
+    size and mtime, so only new or changed images are decoded, in a process pool.
+    """
+    cache = {}
+    if os.path.isfile(cache_path):
+        with open(cache_path, 'r', encoding='utf-8') as f:
+            cache = json.load(f)
+    hashes, todo = {}, []
+    for file in files:
+        stat = os.stat(os.path.join(folder, file))
+        cached = cache.get(file)
+        if cached and cached['size'] == stat.st_size and cached['mtime_ns'] == stat.st_mtime_ns:
+            hashes[file] = cached['hash']
+        else:
+            todo.append((file, stat))
+    
+    if todo:
+        started = time.perf_counter()
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            paths = [os.path.join(folder, file) for file, _ in todo]
+            for (file, stat), image_hash in zip(todo, executor.map(_hash_file, paths, chunksize=4)):
+                hashes[file] = image_hash
+                if image_hash is not None:
+                    cache[file] = {'hash': image_hash, 'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns}
+        tmp_path = cache_path + ".tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(cache, f)
+        os.replace(tmp_path, cache_path)
+        print(f"Hashed {len(todo)} new images in {time.perf_counter() - started:.1f}s "
+              f"({len(files) - len(todo)} from cache)")
+    return hashes
+
+def _as_bits(hex_hashes):
+    return np.array([np.frombuffer(bytes.fromhex(h), dtype=np.uint8) for h in hex_hashes]).reshape(len(hex_hashes), -1)
+
+_POPCOUNT = np.array([bin(i).count('1') for i in range(256)], dtype=np.uint16)
+
+def hamming_distances(hex_hashes, other_hashes, block=512):
+    """Matrix of bit differences between two lists of hex hashes, computed a block of rows at a time"""
+    a, b = _as_bits(hex_hashes), _as_bits(other_hashes)
+    distances = np.empty((len(a), len(b)), dtype=np.uint16)
+    for start in range(0, len(a), block):
+        distances[start:start + block] = _POPCOUNT[a[start:start + block, None, :] ^ b[None, :, :]].sum(axis=2)
+    return distances
+
+class SortDecisions:
+    """Keep/discard/duplicate decisions by perceptual hash, saved to a JSON file after every change"""
+    def __init__(self, path=decisions_path):
+        self.path = path
+        self.decisions = {}
+        if os.path.isfile(path):
+            with open(path, 'r', encoding='utf-8') as f:
+                self.decisions = json.load(f)
+    
+    def record(self, image_hash, file, decision):
+        self.decisions[image_hash] = {'decision': decision, 'file': file,
+                                      'decided_at': datetime.now().strftime("%Y-%m-%d %H:%M:%S")}
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(self.decisions, f, indent=2, sort_keys=True)
+        os.replace(tmp_path, self.path)
+    
+    def nearest(self, hex_hashes):
+        """For each hash, (distance, decision record) of the closest decided hash, or None if there are none"""
+        if not self.decisions or not hex_hashes:
+            return [None] * len(hex_hashes)
+        known = list(self.decisions)
+        distances = hamming_distances(hex_hashes, known)
+        closest = distances.argmin(axis=1)
+        return [(int(distances[i, j]), self.decisions[known[j]]) for i, j in enumerate(closest)]
+
+def _clusters(files, hashes):
+    """Group files whose hashes are within DUPLICATE_DISTANCE (transitively); each group sorted, originals before copies"""
+    parent = list(range(len(files)))
+    def find(i):
+        while parent[i] != i:
+            parent[i] = parent[parent[i]]
+            i = parent[i]
+        return i
+    if len(files) > 1:
+        for i, j in np.argwhere(np.triu(hamming_distances(hashes, hashes) <= DUPLICATE_DISTANCE, 1)):
+            parent[find(i)] = find(j)
+    groups = {}
+    for i, file in enumerate(files):
+        groups.setdefault(find(i), []).append(file)
+    return [sorted(group, key=lambda f: ('copy' in f.lower(), f)) for group in groups.values()]
+
+def keep_file(file):
+    dest_path = os.path.join(dest_dir, file)
+    if not os.path.exists(dest_path):
+        shutil.copy2(os.path.join(source_dir, file), dest_path)
+
+def prepare_review(files, decisions, workers=None):
+    """
+    Batch pre-pass before the interactive sorter.
+
+    Images within DUPLICATE_DISTANCE of an earlier decision get it applied
+    (a re-export of a kept chart counts as a duplicate and is not copied
+    again). The remaining images are grouped into near-duplicate clusters,
+    of which only the first image is reviewed.
+
+    Returns (files to review, {file: rest of its cluster}, {file: suggestion
+    text for images resembling an earlier decision}, {file: hash}).
+    """
+    hashes = compute_hashes(files, workers=workers)
+    hashed = [f for f in files if hashes.get(f)]
+    unhashed = [f for f in files if not hashes.get(f)]
+    
+    unseen, suggestions, applied = [], {}, {}
+    for file, match in zip(hashed, decisions.nearest([hashes[f] for f in hashed])):
+        if match is not None and match[0] <= DUPLICATE_DISTANCE:
+            distance, record = match
+            decision = record['decision']
+            if decision == 'keep' and record['file'] != file:
+                decision = 'duplicate'
+            if decision == 'keep':
+                keep_file(file)
+            applied[decision] = applied.get(decision, 0) + 1
+            continue
+        unseen.append(file)
+        if match is not None and match[0] <= SIMILAR_DISTANCE:
+            suggestions[file] = f"Looks like {match[1]['file']} ({match[1]['decision']})"
+    
+    clusters = _clusters(unseen, [hashes[f] for f in unseen])
+    review = sorted([group[0] for group in clusters] + unhashed)
+    duplicates = {group[0]: group[1:] for group in clusters if len(group) > 1}
+    print(f"{len(files)} images: {sum(applied.values())} decided earlier {applied}, "
+          f"{sum(len(group) for group in duplicates.values())} near-duplicates of new images, "
+          f"{len(review)} to review")
+    return review, duplicates, suggestions, hashes
+
 # Create GUI
 class ImageSorterApp:
-    def __init__(self, root, image_files):
+    def __init__(self, root, image_files, on_decision=None, suggestions=None):
         self.root = root
         self.root.title("Image Sorter")
         self.image_files = image_files
+        # Called as on_decision(file, 'keep' or 'discard'); suggestions are shown under the file name
+        self.on_decision = on_decision
+        self.suggestions = suggestions or {}
         self.current_index = 0
         
         # Set up the GUI components
@@ -45,7 +224,7 @@ class ImageSorterApp:
         self.keep_button = tk.Button(self.button_frame, text="Keep (Y)", command=self.keep_image)
         self.keep_button.pack(side=tk.LEFT, padx=5)
         
-        self.discard_button = tk.Button(self.button_frame, text="Discard (N)", command=self.next_image)
+        self.discard_button = tk.Button(self.button_frame, text="Discard (N)", command=self.discard_image)
         self.discard_button.pack(side=tk.LEFT, padx=5)
         
         self.filename_label = tk.Label(self.frame, text="")
@@ -56,7 +235,7 @@ class ImageSorterApp:
         
         # Bind keyboard shortcuts
         self.root.bind('<y>', lambda e: self.keep_image())
-        self.root.bind('<n>', lambda e: self.next_image())
+        self.root.bind('<n>', lambda e: self.discard_image())
         self.root.bind('<Right>', lambda e: self.next_image())
         self.root.bind('<Left>', lambda e: self.prev_image())
         
@@ -70,7 +249,9 @@ class ImageSorterApp:
         if 0 <= self.current_index < len(self.image_files):
             # Get current image file
             img_path = os.path.join(source_dir, self.image_files[self.current_index])
-            self.filename_label.config(text=self.image_files[self.current_index])
+            suggestion = self.suggestions.get(self.image_files[self.current_index])
+            self.filename_label.config(text=self.image_files[self.current_index]
+                                       + (f"\n{suggestion}" if suggestion else ""))
             
             try:
                 # Open and resize image to fit the canvas
@@ -113,12 +294,19 @@ class ImageSorterApp:
             try:
                 shutil.copy2(source_path, dest_path)
                 print(f"Kept: {self.image_files[self.current_index]}")
+                if self.on_decision:
+                    self.on_decision(self.image_files[self.current_index], 'keep')
             except Exception as e:
                 messagebox.showerror("Error", f"Could not copy file: {str(e)}")
             
             # Move to next image
             self.next_image()
     
+    def discard_image(self):
+        if 0 <= self.current_index < len(self.image_files) and self.on_decision:
+            self.on_decision(self.image_files[self.current_index], 'discard')
+        self.next_image()
+    
     def next_image(self):
         self.current_index += 1
         if self.current_index < len(self.image_files):
@@ -137,6 +325,20 @@ class ImageSorterApp:
 
 # Run the application
 if __name__ == "__main__":
-    root = tk.Tk()
-    app = ImageSorterApp(root, image_files)
-    root.mainloop()
\ No newline at end of file
+    decisions = SortDecisions()
+    review, duplicates, suggestions, hashes = prepare_review(image_files, decisions)
+    
+    def remember(file, decision):
+        # Images that failed to hash can't be recognised later
+        if not hashes.get(file):
+            return
+        decisions.record(hashes[file], file, decision)
+        for duplicate in duplicates.get(file, []):
+            decisions.record(hashes[duplicate], duplicate, 'duplicate' if decision == 'keep' else decision)
+    
+    if review:
+        root = tk.Tk()
+        app = ImageSorterApp(root, review, on_decision=remember, suggestions=suggestions)
+        root.mainloop()
+    else:
+        print("No new images to review.")
\ No newline at end of file